@@ -1,8 +1,7 @@
 import logging
-from django import db
 from django.conf import settings
 from osgeo_importer.inspectors import OGRFieldConverter, BigDateOGRFieldConverter
-from osgeo_importer.utils import database_schema_name
+from osgeo_importer.utils import datastore_connection_string
 
 
 DEFAULT_IMPORT_HANDLERS = []
@@ -73,37 +72,38 @@ class FieldConverterHandler(GetModifiedFieldsMixin, ImportHandlerMixin):
     field_converter = OGRFieldConverter
 
     def convert_field_to_time(self, layer, field):
-        d = db.connections[settings.OSGEO_DATASTORE].settings_dict
-        connection_string = "PG:dbname='%s' user='%s' password='%s' host='%s' port='%s' schemas=%s" % (
-                                                                                            d['NAME'], d['USER'],
-                                                                                            d['PASSWORD'], d['HOST'],
-                                                                                            d['PORT'],
-                                                                                            database_schema_name())
-
-        with self.field_converter(connection_string) as datasource:
+        with self.field_converter(datastore_connection_string()) as datasource:
             return datasource.convert_field(layer, field)
 
+    def convert_fields_to_time(self, layer, fields):
+        """
+        Converts all fields with one pass over the table, returns the new column of each field.
+        """
+        with self.field_converter(datastore_connection_string()) as datasource:
+            return datasource.convert_fields(layer, fields)
+
     @ensure_can_run
     def handle(self, layer, layer_config, *args, **kwargs):
         self.update_date_attributes(layer_config)
+        fields_to_convert = [field for field in set(layer_config.get('convert_to_date', [])) if field]
 
-        try:
-            for field_to_convert in set(layer_config.get('convert_to_date', [])):
-
-                if not field_to_convert:
-                    continue
+        if not fields_to_convert:
+            return
 
-                new_col = self.convert_field_to_time(layer, field_to_convert)
+        try:
+            # Convert the fields before the staging table is moved into place.
+            new_cols = self.convert_fields_to_time(layer_config.get('staging_table', layer), fields_to_convert)
 
-                # if the start_date or end_date needed to be converted to a date
-                # field, use the newly created field name/
+            # if the start_date or end_date needed to be converted to a date
+            # field, use the newly created field name/
+            for field_to_convert, new_col in new_cols.items():
                 for date_option in ('start_date', 'end_date'):
                     if layer_config.get(date_option) == field_to_convert:
                         layer_config[date_option] = new_col.lower()
 
         except Exception:
             logging.exception(
-                "Error while converting value {!r}".format(field_to_convert))
+                "Error while converting values {!r}".format(fields_to_convert))
 
 
 class BigDateFieldConverterHandler(FieldConverterHandler):
@@ -7,6 +7,7 @@ from django.conf import settings
 from osgeo_importer.handlers import ImportHandlerMixin
 from osgeo_importer.handlers import ensure_can_run
 from osgeo_importer.models import UploadLayer
+from osgeo_importer.utils import get_attribute_statistics
 from geonode.layers.models import Layer
 from backward_compatibility import set_attributes
 from django.contrib.auth import get_user_model
@@ -15,6 +16,9 @@ from geonode.base.models import TopicCategory
 User = get_user_model()
 logger = logging.getLogger(__name__)
 
+# Compute the attribute statistics of imported vector layers from the datastore table.
+ATTRIBUTE_STATISTICS = getattr(settings, 'OSGEO_IMPORTER_ATTRIBUTE_STATISTICS', False)
+
 
 class GeoNodePublishHandler(ImportHandlerMixin):
     """
@@ -45,6 +49,19 @@ class GeoNodePublishHandler(ImportHandlerMixin):
         """
         return 'appendTo' not in layer_config
 
+    def attribute_statistics(self, layer_name, fields, layer_config):
+        """
+        Returns the attribute statistics of a layer for set_attributes, None if they cannot be computed.
+        The statistics of fields renamed during the import are read from their column in the datastore.
+        """
+        modified_fields = layer_config.get('modified_fields', {})
+        columns = dict((f['name'], modified_fields.get(f['name'], f['name'])) for f in fields)
+
+        try:
+            return {layer_name: get_attribute_statistics(layer_name, columns)}
+        except db.DatabaseError:
+            logger.exception('Could not compute the attribute statistics of "{}".'.format(layer_name))
+
     @ensure_can_run
     def handle(self, layer, layer_config, *args, **kwargs):
         """
@@ -133,7 +150,12 @@ class GeoNodePublishHandler(ImportHandlerMixin):
         # Add fields to new_layer.attribute_set
         if fields:
             attribute_map = [[f['name'], f['type']] for f in fields]
-            set_attributes(new_layer, attribute_map)
+            attribute_stats = None
+
+            if layer_type == 'vector' and ATTRIBUTE_STATISTICS:
+                attribute_stats = self.attribute_statistics(new_layer.name, fields, layer_config)
+
+            set_attributes(new_layer, attribute_map, attribute_stats=attribute_stats)
 
         if self.importer.upload_file and created:
             upload_layer = UploadLayer.objects.get(upload_file=self.importer.upload_file.pk,
@@ -1,5 +1,6 @@
 import logging
 import os
+import time
 
 from django import db
 from django.conf import settings
@@ -10,19 +11,23 @@ import osr
 
 from osgeo_importer.models import UploadLayer
 
-from .handlers import IMPORT_HANDLERS
+from .handlers import IMPORT_HANDLERS, FieldConverterHandler
 from .inspectors import GDALInspector, OGRInspector
 from .utils import (
     FileTypeNotAllowed,
     GdalErrorHandler,
+    get_layer_encoding,
     load_handler,
     increment_filename,
     raster_import,
-    decode,
-    convert_wkt_to_epsg,
-    reproject_coordinate_system,
-    database_schema_name
+    database_schema_name,
+    datasource_pool,
+    datastore_connection_string,
+    quote_ident,
+    GDAL_GEOMETRY_TYPES
 )  # noqa: F401
+from .writers import (CSVCopyWriter, ImportProgress, OGRFeatureWriter, ParallelCopyWriter, VectorTranslateWriter,
+                      flush_target_layer)
 
 
 logger = logging.getLogger(__name__)
@@ -36,6 +41,18 @@ VALID_EXTENSIONS = getattr(settings, 'OSGEO_IMPORTER_VALID_EXTENSIONS', DEFAULT_
 
 RASTER_FILES = getattr(settings, 'OSGEO_IMPORTER_RASTER_FILES', os.path.join(MEDIA_ROOT, 'osgeo_importer_raster'))
 UPLOAD_DIR = getattr(settings, 'OSGEO_IMPORTER_UPLOAD_DIR', os.path.join(MEDIA_ROOT, 'osgeo_importer_uploads'))
+# Number of features written to the target per transaction, 0 disables batching.
+TRANSACTION_SIZE = getattr(settings, 'OSGEO_IMPORTER_TRANSACTION_SIZE', 10000)
+FEATURE_WRITER = getattr(settings, 'OSGEO_IMPORTER_FEATURE_WRITER', 'osgeo_importer.writers.OGRFeatureWriter')
+# Copy layers that need no per-feature fixups with gdal.VectorTranslate.
+VECTOR_TRANSLATE = getattr(settings, 'OSGEO_IMPORTER_VECTOR_TRANSLATE', True)
+# Number of processes copying ranges of a single large layer concurrently, 1 disables the parallel copy.
+PARALLEL_COPY_PROCESSES = getattr(settings, 'OSGEO_IMPORTER_PARALLEL_COPY_PROCESSES', 1)
+PARALLEL_COPY_MIN_FEATURES = getattr(settings, 'OSGEO_IMPORTER_PARALLEL_COPY_MIN_FEATURES', 1000000)
+# Load CSV files into PostGIS with COPY and build their geometries in SQL.
+CSV_COPY = getattr(settings, 'OSGEO_IMPORTER_CSV_COPY', False)
+# Load PostGIS layers into an UNLOGGED staging table that is moved into place after the field converters ran.
+UNLOGGED_STAGING = getattr(settings, 'OSGEO_IMPORTER_UNLOGGED_STAGING', False)
 
 if not os.path.exists(RASTER_FILES):
     os.makedirs(RASTER_FILES)
@@ -129,9 +146,26 @@ class Import(object):
         :return: A list of handler results.
         """
         self.handler_results = []
+
+        # Report the time spent on each step of the load along with the handler results.
+        timings = layer_config.pop('timings', None)
+        if timings:
+            self.handler_results.append({type(self).__name__: timings})
+
         for handler in self.import_handlers:
+            # Field converters work on the staging table, every other handler needs the final table.
+            if layer_config.get('staging_table') and not isinstance(handler, FieldConverterHandler):
+                self.promote_staging_table(layer, layer_config)
+
+            if layer_config.get('upload_layer_id'):
+                UploadLayer.objects.filter(id=layer_config['upload_layer_id']).update(
+                    import_stage=type(handler).__name__)
+
             self.handler_results.append({type(handler).__name__: handler.handle(layer, layer_config, *args, **kwargs)})
 
+        if layer_config.get('staging_table'):
+            self.promote_staging_table(layer, layer_config)
+
         return self.handler_results
 
     def open_datastore(self, connection_string, inspectors, *args, **kwargs):
@@ -146,7 +180,7 @@ class Import(object):
 
         for inspector in inspectors:
             insp = inspector(connection_string, *args, **kwargs)
-            data = insp.open()
+            data = insp.open(*args, **kwargs)
             if data is not None:
                 return data, insp
 
@@ -165,6 +199,15 @@ class OGRImport(Import):
 
     source_inspectors = [GDALInspector]
     target_inspectors = [OGRInspector]
+    # Drivers whose layer geometry type does not reliably describe the geometries of its features.
+    formats_to_inspect = ['esri shapefile', 'kml', 'libkml']
+    transaction_size = TRANSACTION_SIZE
+    feature_writer = FEATURE_WRITER
+    vector_translate = VECTOR_TRANSLATE
+    parallel_copy_processes = PARALLEL_COPY_PROCESSES
+    parallel_copy_min_features = PARALLEL_COPY_MIN_FEATURES
+    unlogged_staging = UNLOGGED_STAGING
+    csv_copy = CSV_COPY
 
     def __init__(self, filename, target_store=None, upload_file=None):
         self.file = filename
@@ -172,13 +215,9 @@ class OGRImport(Import):
         self.completed_layers = []
 
         if target_store is None:
-            d = db.connections[settings.OSGEO_DATASTORE].settings_dict
-            connection_string = "PG:dbname='%s' user='%s' password='%s' host='%s' port='%s' schemas=%s" % (
-                                                                                                d['NAME'], d['USER'],
-                                                                                                d['PASSWORD'],
-                                                                                                d['HOST'], d['PORT'],
-                                                                                                database_schema_name())
-            self.target_store = connection_string
+            target_store = datastore_connection_string()
+
+        self.target_store = target_store
 
     def open_target_datastore(self, connection_string, *args, **kwargs):
         """
@@ -220,32 +259,243 @@ class OGRImport(Import):
         OGRMultiPolygon.
         """
         driver = source.GetDriver().ShortName.lower()
-        formats_to_inspect = ['esri shapefile', 'kml', 'libkml']
         layer_geom_type = layer.GetGeomType()
 
-        if driver in formats_to_inspect:
-            features_geom_types = self.get_features_geometry_types(layer)
-
-            types_dict = {
-                'MultiPoint_Point': [1, 4],
-                'MultiLineString_LineString': [2, 5],
-                'MutliPolygon_Polygon': [3, 6]
-            }
-
-            for k in types_dict:
-                if all(t in features_geom_types for t in types_dict[k]):
-                    plural, singular = k.split('_')
-                    logger.warn("Found {plural} and {singular} geometry types in dataset, using {plural}".format(
-                                      plural=plural, singular=singular))
-                    layer_geom_type = max(types_dict[k])
-                    break
+        if driver in self.formats_to_inspect:
+            layer_geom_type = self.resolve_geometry_type(layer_geom_type, self.get_features_geometry_types(layer))
 
-            # Cover a case where KML/LIBKML layer geometry type is Geometry/Unknown, but don't fail
-            if layer_geom_type == 0:
-                layer_geom_type = max(features_geom_types) if features_geom_types else layer_geom_type
+        return layer_geom_type
+
+    @staticmethod
+    def resolve_geometry_type(layer_geom_type, features_geom_types):
+        """
+        Returns the geometry type to use for a layer given the distinct geometry types of its features: Multi*
+        when both single and Multi* geometries are present, the largest feature type when the layer type is
+        Geometry/Unknown.
+        """
+        types_dict = {
+            'MultiPoint_Point': [1, 4],
+            'MultiLineString_LineString': [2, 5],
+            'MutliPolygon_Polygon': [3, 6]
+        }
+
+        for k in types_dict:
+            if all(t in features_geom_types for t in types_dict[k]):
+                plural, singular = k.split('_')
+                logger.warn("Found {plural} and {singular} geometry types in dataset, using {plural}".format(
+                                  plural=plural, singular=singular))
+                layer_geom_type = max(types_dict[k])
+                break
+
+        # Cover a case where KML/LIBKML layer geometry type is Geometry/Unknown, but don't fail
+        if layer_geom_type == 0:
+            layer_geom_type = max(features_geom_types) if features_geom_types else layer_geom_type
 
         return layer_geom_type
 
+    @staticmethod
+    def has_other_geometry_types(layer, geom_type):
+        """
+        Returns True if a feature of the layer has a geometry of another type than `geom_type`, reading the layer
+        up to the first such feature only.
+        """
+        try:
+            for feature in layer:
+                if feature and feature.geometry() and feature.geometry().GetGeometryType() != geom_type:
+                    return True
+        finally:
+            layer.ResetReading()
+
+        return False
+
+    def get_target_geometry_types(self, target_layer):
+        """
+        Returns the distinct geometry types stored in a PostGIS target layer.
+        """
+        flush_target_layer(target_layer)
+        table = '{0}.{1}'.format(quote_ident(database_schema_name()), quote_ident(target_layer.GetName()))
+        column = quote_ident(target_layer.GetGeometryColumn())
+        geom_types_by_name = {name.upper(): geom_type for geom_type, name in GDAL_GEOMETRY_TYPES.items()
+                              if geom_type in range(1, 8)}
+        geom_types = set()
+
+        with db.connections[settings.OSGEO_DATASTORE].cursor() as cursor:
+            cursor.execute('SELECT DISTINCT GeometryType({0}), ST_NDims({0}) FROM {1} WHERE {0} IS NOT NULL;'
+                           .format(column, table))
+            for name, dimensions in cursor.fetchall():
+                geom_type = geom_types_by_name.get(name, ogr.wkbUnknown)
+                geom_types.add(geom_type | ogr.wkb25DBit if dimensions > 2 and geom_type else geom_type)
+
+        return geom_types
+
+    @staticmethod
+    def get_coordinate_transformation(source_srs, target_srs):
+        """
+        Returns an osr.CoordinateTransformation between two spatial references using the traditional GIS axis
+        order (x/longitude first) where GDAL supports axis mapping strategies.
+        """
+        if hasattr(osr, 'OAMS_TRADITIONAL_GIS_ORDER'):
+            for srs in (source_srs, target_srs):
+                srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+
+        return osr.CoordinateTransformation(source_srs, target_srs)
+
+    def get_feature_writer(self, data, layer, target_datastore, target_layer, source_fid=None, resume=False,
+                           **writer_options):
+        """
+        Returns the writer used to copy a layer: a COPY of the whole file for CSV files (when enabled), a parallel
+        range copy for large layers (when enabled),
+        gdal.VectorTranslate for layers that need no per-feature fixups (when enabled), otherwise the configured
+        feature writer, falling back to the OGR writer when the configured writer cannot write to the target
+        datastore.  Retried copies always use a checkpointing writer, so an import interrupted again resumes after
+        the last checkpoint instead of starting over with a writer that never saves one.
+
+        :param writer_options: Keyword arguments of the writers (transform, encoding, progress).
+        """
+        writers = [load_handler(self.feature_writer, self, data, **writer_options),
+                   OGRFeatureWriter(self, data, **writer_options)]
+
+        if self.vector_translate and not resume:
+            writers.insert(0, VectorTranslateWriter(self, data, **writer_options))
+
+        if self.parallel_copy_processes > 1 and not resume:
+            writers.insert(0, ParallelCopyWriter(self, data, **writer_options))
+
+        if self.csv_copy and not resume:
+            writers.insert(0, CSVCopyWriter(self, data, **writer_options))
+
+        for writer in writers:
+            if writer.can_write(layer, target_datastore, target_layer, source_fid=source_fid):
+                return writer
+
+    def copy_features(self, data, layer, target_datastore, target_layer, layer_options, source_fid=None,
+                      resume=False, **writer_options):
+        """
+        Copies the features of a source layer into the target layer, reprojecting the geometries with the
+        `transform` (an osr.CoordinateTransformation), decoding strings from the `encoding` and reporting to the
+        `progress` (an ImportProgress) writer options if provided.
+
+        :return: The writer, holding the number of features written and the geometry types it saw.
+        """
+        writer = self.get_feature_writer(data, layer, target_datastore, target_layer, source_fid=source_fid,
+                                         resume=resume, **writer_options)
+        logger.info('Copying features of "{}" with {}'.format(layer.GetName(), type(writer).__name__))
+        writer.write(layer, target_layer, layer_options, source_fid=source_fid)
+        return writer
+
+    def set_geometry_type(self, target_layer, geom_type):
+        """
+        Converts the geometry column of a PostGIS target layer to `geom_type` in one statement, promoting single
+        geometries with ST_Multi when `geom_type` is a Multi* type.  The column is generic when `geom_type` is
+        wkbUnknown.
+
+        :param target_layer: The OGR layer the features were written to.
+        :param geom_type: The OGR geometry type of the column.
+        """
+        flush_target_layer(target_layer)
+
+        schema = database_schema_name()
+        table = '{0}.{1}'.format(quote_ident(schema), quote_ident(target_layer.GetName()))
+        column = quote_ident(target_layer.GetGeometryColumn())
+        type_name = GDAL_GEOMETRY_TYPES[ogr.GT_Flatten(geom_type)] if ogr.GT_Flatten(geom_type) else 'Geometry'
+
+        if ogr.GT_HasZ(geom_type):
+            type_name += 'Z'
+
+        using = 'ST_Multi({0})' if ogr.GT_Flatten(geom_type) in range(4, 7) else '{0}'
+
+        with db.connections[settings.OSGEO_DATASTORE].cursor() as cursor:
+            cursor.execute('SELECT Find_SRID(%s, %s, %s);', (schema, target_layer.GetName(),
+                                                             target_layer.GetGeometryColumn()))
+            srid = cursor.fetchone()[0]
+            logger.info('Setting the geometry type of {} to {}'.format(table, type_name))
+            cursor.execute('ALTER TABLE {0} ALTER COLUMN {1} TYPE geometry({2}, {3}) USING {4};'.format(
+                table, column, type_name, int(srid), using.format(column)))
+
+    def clear_geometry_type(self, target_layer):
+        """
+        Empties a PostGIS target layer and makes its geometry column generic, keeping its SRID and dimensions.
+        """
+        flush_target_layer(target_layer)
+        table = '{0}.{1}'.format(quote_ident(database_schema_name()), quote_ident(target_layer.GetName()))
+
+        with db.connections[settings.OSGEO_DATASTORE].cursor() as cursor:
+            cursor.execute('TRUNCATE {0};'.format(table))
+
+        geom_type = ogr.wkbUnknown | ogr.wkb25DBit if ogr.GT_HasZ(target_layer.GetGeomType()) else ogr.wkbUnknown
+        self.set_geometry_type(target_layer, geom_type)
+
+    def create_spatial_index(self, target_layer):
+        """
+        Builds the GIST index of a PostGIS target layer once the features are loaded.
+        """
+        flush_target_layer(target_layer)
+
+        table = '{0}.{1}'.format(quote_ident(database_schema_name()), quote_ident(target_layer.GetName()))
+        column = target_layer.GetGeometryColumn()
+        index = quote_ident('{0}_{1}_geom_idx'.format(target_layer.GetName(), column))
+
+        with db.connections[settings.OSGEO_DATASTORE].cursor() as cursor:
+            logger.info('Creating the spatial index of {}'.format(table))
+            cursor.execute('CREATE INDEX IF NOT EXISTS {0} ON {1} USING GIST ({2});'.format(
+                index, table, quote_ident(column)))
+
+    def analyze(self, target_layer):
+        """
+        Updates the planner statistics of a PostGIS target layer.
+        """
+        table = '{0}.{1}'.format(quote_ident(database_schema_name()), quote_ident(target_layer.GetName()))
+
+        with db.connections[settings.OSGEO_DATASTORE].cursor() as cursor:
+            cursor.execute('ANALYZE {0};'.format(table))
+
+    @staticmethod
+    def get_staging_table_name(layer_name):
+        """
+        Returns the name of the staging table of a layer, within PostgreSQL's 63 character identifier limit.
+        """
+        return '{0}_staging'.format(layer_name[:55])
+
+    def promote_staging_table(self, layer, layer_config):
+        """
+        Moves a layer's UNLOGGED staging table into place as a LOGGED table named after the layer in one
+        transaction, so a half-loaded table is never visible under the layer name.  The indexes and sequences
+        named after the staging table are renamed along with it.
+
+        SET LOGGED rewrites the table and its indexes, and unless wal_level is minimal the rewrite is WAL-logged
+        (and replicated) in full.  The WAL saved is that of the load, the field conversions and the index builds
+        run on the staging table, not that of the final table.
+
+        :param layer: The name of the imported layer.
+        :param layer_config: The layer configuration holding the name of the staging table.
+        """
+        staging_table = layer_config.pop('staging_table')
+        schema = quote_ident(database_schema_name())
+        table = '{0}.{1}'.format(schema, quote_ident(staging_table))
+        relation_types = {'i': 'INDEX', 'S': 'SEQUENCE'}
+
+        logger.info('Moving staging table {} into place as {}'.format(table, layer))
+
+        with db.transaction.atomic(using=settings.OSGEO_DATASTORE):
+            with db.connections[settings.OSGEO_DATASTORE].cursor() as cursor:
+                cursor.execute('ALTER TABLE {0} SET LOGGED;'.format(table))
+                cursor.execute(
+                    "SELECT relname, relkind FROM pg_class WHERE oid IN ("
+                    "SELECT indexrelid FROM pg_index WHERE indrelid = %s::regclass UNION "
+                    "SELECT objid FROM pg_depend WHERE refobjid = %s::regclass AND deptype = 'a' "
+                    "AND classid = 'pg_class'::regclass);", (table, table))
+
+                for name, kind in cursor.fetchall():
+                    if name.startswith(staging_table) and kind in relation_types:
+                        cursor.execute('ALTER {0} {1}.{2} RENAME TO {3};'.format(
+                            relation_types[kind], schema, quote_ident(name),
+                            quote_ident(layer + name[len(staging_table):])))
+
+                cursor.execute('ALTER TABLE {0} RENAME TO {1};'.format(table, quote_ident(layer)))
+
+        # Pooled datasources still list the staging table.
+        datasource_pool.clear(self.target_store)
+
     def import_file(self, *args, **kwargs):
         """
         Loads data that has been uploaded into whatever format we need for serving.
@@ -297,7 +547,14 @@ class OGRImport(Import):
                         ul.layer_name = co['layer_name']
                         ul.save()
 
-        data, inspector = self.open_source_datastore(filename, *args, **kwargs)
+        # Drivers supporting it (shapefiles) recode the attributes to an explicitly configured encoding themselves.
+        self.source_open_options = {}
+        encodings = [co['encoding'] for co in configuration_options if co.get('encoding')]
+
+        if encodings:
+            self.source_open_options['encoding'] = encodings[0]
+
+        data, inspector = self.open_source_datastore(filename, *args, **dict(kwargs, **self.source_open_options))
 
         datastore_layers = inspector.describe_fields()
 
@@ -364,12 +621,14 @@ class OGRImport(Import):
                 raster_import(layer_options['path'], fileout)
                 self.completed_layers.append([fileout, layer_options])
             elif layer_options['layer_type'] == 'vector':
-                target_file, _ = self.open_target_datastore(self.target_store)
+                target_file, target_inspector = self.open_target_datastore(self.target_store)
                 target_create_options = []
 
                 # Prevent numeric field overflow for shapefiles https://trac.osgeo.org/gdal/ticket/5241
                 if target_file.GetDriver().GetName() == 'PostgreSQL':
                     target_create_options.append('PRECISION=NO')
+                    # Build the spatial index once after the load instead of maintaining it for every insert.
+                    target_create_options.append('SPATIAL_INDEX=NO')
                     # Hack for CSV ingest into postgres. When using COPY, OGR prepends a bad newline to each feature
                     if data.GetDriver().ShortName.lower() == 'csv':
                         os.environ["PG_USE_COPY"] = "false"
@@ -379,7 +638,18 @@ class OGRImport(Import):
                 layer_options['modified_fields'] = {}
                 layer = data.GetLayer(layer_options.get('index'))
                 layer_name = layer_options['layer_name']
-                layer_geom_type = self.get_layer_type(layer, data)
+                is_postgres = target_file.GetDriver().GetName() == 'PostgreSQL'
+
+                # When the feature geometry types have to be inspected, record them while copying instead of
+                # reading the source twice and only change the column type of the PostGIS table after the load
+                # when the features do not match the declared layer type.
+                deferred_geom_type = (is_postgres and
+                                      data.GetDriver().ShortName.lower() in self.formats_to_inspect)
+
+                if deferred_geom_type:
+                    layer_geom_type = layer.GetGeomType()
+                else:
+                    layer_geom_type = self.get_layer_type(layer, data)
                 srs = layer.GetSpatialRef()
 
                 # default the layer to 4326 if a spatial reference is not provided
@@ -388,25 +658,50 @@ class OGRImport(Import):
                     srs.ImportFromEPSG(4326)
 
                 # pass the srs authority code to handlers
+                transform = None
                 if srs.AutoIdentifyEPSG() == 0:
                     layer_options['srs'] = '{0}:{1}'.format(srs.GetAuthorityName(None), srs.GetAuthorityCode(None))
                 else:
-                    # layer_options['srs'] = convert_wkt_to_epsg(srs.ExportToWkt())
-                    layer_ids = []
-                    for configuration_option in configuration_options:
-                        layer_ids = [configuration_option['upload_layer_id']]
-                    layer_id = layer_ids[0]
-                    layer_path = os.path.dirname(filename)
-                    original_layer_name = layer.GetName()
-                    layer_options['srs'] = reproject_coordinate_system(original_layer_name, layer_name, layer, layer_path)
-                    data, inspector = self.open_source_datastore(filename, *args, **kwargs)
-                    target_file, _ = self.open_target_datastore(self.target_store)
-                    layer = data.GetLayer(layer_options.get('index'))
-                    srs = layer.GetSpatialRef()
-
-                logger.info('Creating dataset "{}" from file "{}"'.format(layer_name, target_file))
-                target_layer = self.create_target_dataset(target_file, str(layer_name), srs, layer_geom_type,
-                                                          options=target_create_options)
+                    # Reproject the features to EPSG:4326 while they are copied to the target.
+                    target_srs = osr.SpatialReference()
+                    target_srs.ImportFromEPSG(4326)
+                    transform = self.get_coordinate_transformation(srs, target_srs)
+                    layer_options['srs'] = '{0}:{1}'.format(target_srs.GetAuthorityName(None),
+                                                            target_srs.GetAuthorityCode(None))
+                    srs = target_srs
+
+                target_name = layer_name
+                if is_postgres and self.unlogged_staging:
+                    # Skip the WAL for the load and the steps before the promotion, setting the table LOGGED
+                    # when it is moved into place WAL-logs the final table once.
+                    target_name = layer_options['staging_table'] = self.get_staging_table_name(layer_name)
+                    target_create_options.extend(['UNLOGGED=YES', 'OVERWRITE=YES'])
+
+                # A retried import resumes after the last checkpointed FID if the table it was loading still exists.
+                upload_layer = upload_layers_by_id[layer_options['upload_layer_id']]
+                resume_fid = None
+
+                if layer_options.get('resume') and upload_layer.checkpoint_fid is not None:
+                    try:
+                        target_layer = target_file.GetLayerByName(str(target_name))
+                    except RuntimeError:
+                        target_layer = None
+
+                    if target_layer is not None:
+                        resume_fid = upload_layer.checkpoint_fid
+
+                if resume_fid is None:
+                    if layer_options.get('resume'):
+                        # Start over, dropping whatever the interrupted import left in the table.
+                        target_create_options.append('OVERWRITE=YES')
+
+                    UploadLayer.objects.filter(id=upload_layer.id).update(checkpoint_fid=None)
+                    logger.info('Creating dataset "{}" from file "{}"'.format(target_name, target_file))
+                    target_layer = self.create_target_dataset(target_file, str(target_name), srs, layer_geom_type,
+                                                              options=target_create_options)
+                else:
+                    logger.info('Resuming the import of "{}" after FID {}'.format(target_name, resume_fid))
+                    layer.SetAttributeFilter('FID > {0}'.format(int(resume_fid)))
 
                 # adding fields to new layer
                 layer_definition = ogr.Feature(layer.GetLayerDefn())
@@ -422,7 +717,8 @@ class OGRImport(Import):
                         field_def.SetType(0)
 
                     if field_def.GetName() != 'wkb_geometry':
-                        target_layer.CreateField(field_def)
+                        if resume_fid is None:
+                            target_layer.CreateField(field_def)
                         new_name = target_layer.GetLayerDefn().GetFieldDefn(i - wkb_field).GetName()
                         old_name = field_def.GetName()
 
@@ -437,46 +733,80 @@ class OGRImport(Import):
                 if wkb_field is not 0:
                     layer.SetIgnoredFields(['wkb_geometry'])
 
-                for feature in layer:
-                    if feature and feature.geometry():
-
-                        if not layer.GetFIDColumn():
-                            feature.SetFID(-1)
-
-                        if feature.geometry().GetGeometryType() != target_layer.GetGeomType() and \
-                                target_layer.GetGeomType() in range(4, 7):
-
-                            if target_layer.GetGeomType() == 5:
-                                conversion_function = ogr.ForceToMultiLineString
-                            elif target_layer.GetGeomType() == 4:
-                                conversion_function = ogr.ForceToMultiPoint
-                            else:
-                                conversion_function = ogr.ForceToMultiPolygon
-
-                            geom = ogr.CreateGeometryFromWkb(feature.geometry().ExportToWkb())
-                            feature.SetGeometry(conversion_function(geom))
-
-                        if source_fid is not None:
-                            feature.SetFID(feature.GetField(source_fid))
-
-                        for field in range(0, feature.GetFieldCount()):
-                            if feature.GetFieldType(field) == ogr.OFTString:
-                                try:
-                                    feature.GetField(field).decode('utf8')
-                                except UnicodeDecodeError:
-                                    feature.SetField(field, decode(feature.GetField(field)))
-                                except AttributeError:
-                                    continue
-                        try:
-                            target_layer.CreateFeature(feature)
-                        except err as e:
-                            logger.error('Create feature failed: {0}'.format(gdal.GetLastErrorMsg()))
-                            raise e
-                layer.ResetReading()
-                self.completed_layers.append([target_layer.GetName(), layer_options])
+                timings = layer_options['timings'] = {}
+                # Inspection may have left the count unknown or estimated it, see OSGEO_IMPORTER_FEATURE_COUNT_MODE.
+                feature_count = upload_layer.feature_count or max(layer.GetFeatureCount(0), 0) or None
+                progress = ImportProgress(upload_layer.id, path=self.file, feature_count=feature_count)
+                progress.stage('copy_features')
+                start = time.time()
+                # Resolve the encoding of the string fields once instead of trying encodings for every value.
+                encoding = get_layer_encoding(layer, encoding=layer_options.get('encoding'))
+                copy_options = dict(source_fid=source_fid, resume=bool(layer_options.get('resume')),
+                                    transform=transform, encoding=encoding, progress=progress)
+                column_geom_type = target_layer.GetGeomType()
+
+                try:
+                    writer = self.copy_features(data, layer, target_file, target_layer, layer_options, **copy_options)
+                except (RuntimeError, db.DatabaseError):
+                    # A layer declared with a single geometry type may mix in Multi* geometries, which the typed
+                    # column rejects.  Load them as-is into a generic column and promote them after the load.
+                    if not (deferred_geom_type and column_geom_type != ogr.wkbUnknown and
+                            self.has_other_geometry_types(layer, column_geom_type)):
+                        raise
+
+                    logger.warn('"{}" mixes geometry types, reloading it into a generic geometry column'.format(
+                        target_name))
+                    self.clear_geometry_type(target_layer)
+                    column_geom_type = ogr.wkbUnknown
+                    layer.SetAttributeFilter(None)
+                    resume_fid = None
+                    UploadLayer.objects.filter(id=upload_layer.id).update(checkpoint_fid=None)
+                    writer = self.copy_features(data, layer, target_file, target_layer, layer_options, **copy_options)
+
+                timings['copy_features'] = time.time() - start
+                progress.update(writer.count, force=True)
+                # Replace the count of the inspection with the number of features actually imported.
+                imported = target_layer.GetFeatureCount() if resume_fid is not None else writer.count
+                UploadLayer.objects.filter(id=upload_layer.id).update(feature_count=imported)
+                progress.stage('set_geometry_type')
+                start = time.time()
+
+                if deferred_geom_type:
+                    features_geom_types = writer.geometry_types
+                    # A resumed copy only saw the features after the checkpoint.
+                    if features_geom_types is None or resume_fid is not None:
+                        features_geom_types = self.get_target_geometry_types(target_layer)
+                    layer_geom_type = self.resolve_geometry_type(
+                        layer_geom_type, list(features_geom_types) + [layer.GetGeomType()])
+
+                    if layer_geom_type not in (ogr.wkbUnknown, column_geom_type):
+                        self.set_geometry_type(target_layer, layer_geom_type)
+
+                if is_postgres:
+                    timings['set_geometry_type'] = time.time() - start
+                    progress.stage('create_spatial_index')
+                    start = time.time()
+                    self.create_spatial_index(target_layer)
+                    timings['create_spatial_index'] = time.time() - start
+                    progress.stage('analyze')
+                    start = time.time()
+                    self.analyze(target_layer)
+                    timings['analyze'] = time.time() - start
+
+                if layer_options.get('staging_table'):
+                    self.completed_layers.append([layer_name, layer_options])
+                else:
+                    self.completed_layers.append([target_layer.GetName(), layer_options])
+
+                # Only return the target datasource to the pool once the layer was imported successfully.
+                target_inspector.close()
             else:
                 msg = 'Unexpected layer type: "{}"'.format(layer_options['layer_type'])
                 logger.error(msg)
                 raise Exception(msg)
 
+        # A large GeoJSON file is streamed from a sequence written next to it, which a retried import reuses.
+        if hasattr(inspector, 'remove_geojson_sequence'):
+            inspector.remove_geojson_sequence()
+
         return self.completed_layers
@@ -1,4 +1,7 @@
+from cStringIO import StringIO
+import csv
 from logging import getLogger
+from multiprocessing.pool import ThreadPool
 import os
 import sqlite3
 
@@ -6,7 +9,10 @@ from django import db
 from django.conf import settings
 import gdal
 import ogr
-from osgeo_importer.utils import NoDataSourceFound, GDAL_GEOMETRY_TYPES, increment, timeparse, quote_ident, parse
+from osgeo_importer.utils import (
+    NoDataSourceFound, GDAL_GEOMETRY_TYPES, NUMERIC_TYPES, increment, timeparse_array, quote_ident, parse_date,
+    datasource_pool, geojson_to_geojsonseq, inspection_cache, date_parse_cache
+)
 
 
 gdal.UseExceptions()
@@ -14,6 +20,23 @@ ogr.UseExceptions()
 logger = getLogger(__name__)
 
 OSGEO_INSPECTOR = getattr(settings, 'OSGEO_INSPECTOR', 'osgeo_importer.inspectors.GDALInspector')
+# GeoJSON files of at least this many bytes are read as a GeoJSON sequence, 0 disables streaming.
+GEOJSON_STREAMING_SIZE = getattr(settings, 'OSGEO_IMPORTER_GEOJSON_STREAMING_SIZE', 100 * 1024 * 1024)
+
+IMPORT_CSV_X_FIELDS = getattr(settings, 'IMPORT_CSV_X_FIELDS', ['Lon*', 'x', 'lon*'])
+IMPORT_CSV_Y_FIELDS = getattr(settings, 'IMPORT_CSV_Y_FIELDS', ['Lat*', 'y', 'lat*'])
+IMPORT_CSV_GEOM_FIELDS = getattr(settings, 'IMPORT_CSV_GEOM_FIELDS',
+                                 ['geom', 'GEOM', 'WKT', 'the_geom', 'THE_GEOM', 'WKB', 'wkb_geometry'])
+# Let OGR detect the types of CSV columns from the first IMPORT_CSV_AUTODETECT_SIZE_LIMIT bytes of the file.
+IMPORT_CSV_AUTODETECT_TYPE = getattr(settings, 'IMPORT_CSV_AUTODETECT_TYPE', False)
+IMPORT_CSV_AUTODETECT_SIZE_LIMIT = getattr(settings, 'IMPORT_CSV_AUTODETECT_SIZE_LIMIT', 1000000)
+# How describe_fields counts features: 'exact' scans layers without a fast count, 'fast' leaves their count
+# unknown and 'estimate' extrapolates it from the size of the first FEATURE_COUNT_SAMPLE_SIZE features.
+FEATURE_COUNT_MODE = getattr(settings, 'OSGEO_IMPORTER_FEATURE_COUNT_MODE', 'exact')
+FEATURE_COUNT_SAMPLE_SIZE = getattr(settings, 'OSGEO_IMPORTER_FEATURE_COUNT_SAMPLE_SIZE', 1000)
+# Subdatasets are described from their metadata, opening each of them to read its size and bands is opt-in.
+INSPECT_SUBDATASETS = getattr(settings, 'OSGEO_IMPORTER_INSPECT_SUBDATASETS', False)
+INSPECT_SUBDATASETS_THREADS = getattr(settings, 'OSGEO_IMPORTER_INSPECT_SUBDATASETS_THREADS', 4)
 
 
 class InspectorMixin(object):
@@ -62,10 +85,9 @@ class OGRInspector(InspectorMixin):
 
     def open(self, *args, **kwargs):
         """
-        Opens the connection_string.
+        Opens the connection_string, reusing an idle writable datasource of this process if there is one.
         """
-        # "1" argument makes the data writeable
-        self.data = ogr.Open(self.connection_string, 1)
+        self.data = datasource_pool.acquire(self.connection_string)
 
         if self.data is None:
             msg = 'ogr.Open() failed with connection string: "{}"'.format(self.connection_string)
@@ -75,6 +97,7 @@ class OGRInspector(InspectorMixin):
         return self.data
 
     def close(self, *args, **kwargs):
+        datasource_pool.release(self.connection_string, self.data)
         self.data = None
 
 
@@ -85,6 +108,9 @@ class GDALInspector(InspectorMixin):
     def __init__(self, connection_string, *args, **kwargs):
         self.file = connection_string
         self.data = None
+        self.open_kwargs = {}
+        # GeoJSON sequence the file is read from, see prepare_geojson.
+        self.geojson_sequence = None
         super(GDALInspector, self).__init__(*args, **kwargs)
 
     def close(self, *args, **kwargs):
@@ -102,23 +128,77 @@ class GDALInspector(InspectorMixin):
 
     def prepare_csv(self, filename, *args, **kwargs):
         """
-        Adds the <X|Y|GEOM>_POSSIBLE_NAMES opening options.
+        Adds the <X|Y|GEOM>_POSSIBLE_NAMES opening options, and the AUTODETECT_TYPE options when enabled.
         """
-        x_possible = getattr(settings, 'IMPORT_CSV_X_FIELDS', ['Lon*', 'x', 'lon*'])
-        y_possible = getattr(settings, 'IMPORT_CSV_Y_FIELDS', ['Lat*', 'y', 'lat*'])
-        geom_possible = getattr(settings, 'IMPORT_CSV_GEOM_FIELDS',
-                                ['geom', 'GEOM', 'WKT', 'the_geom', 'THE_GEOM', 'WKB', 'wkb_geometry'])
+        oo = list(kwargs.get('open_options', []))
 
-        oo = kwargs.get('open_options', [])
+        oo.append('X_POSSIBLE_NAMES={0}'.format(','.join(IMPORT_CSV_X_FIELDS)))
+        oo.append('Y_POSSIBLE_NAMES={0}'.format(','.join(IMPORT_CSV_Y_FIELDS)))
+        oo.append('GEOM_POSSIBLE_NAMES={0}'.format(','.join(IMPORT_CSV_GEOM_FIELDS)))
 
-        oo.append('X_POSSIBLE_NAMES={0}'.format(','.join(x_possible)))
-        oo.append('Y_POSSIBLE_NAMES={0}'.format(','.join(y_possible)))
-        oo.append('GEOM_POSSIBLE_NAMES={0}'.format(','.join(geom_possible)))
+        if IMPORT_CSV_AUTODETECT_TYPE:
+            oo.append('AUTODETECT_TYPE=YES')
+            oo.append('AUTODETECT_SIZE_LIMIT={0}'.format(IMPORT_CSV_AUTODETECT_SIZE_LIMIT))
 
         kwargs['open_options'] = oo
 
         return filename, args, kwargs
 
+    def prepare_shp(self, filename, *args, **kwargs):
+        """
+        Adds the ENCODING opening option when an encoding is configured, OGR then recodes the attributes to UTF-8.
+        """
+        encoding = kwargs.get('encoding')
+
+        if encoding:
+            kwargs['open_options'] = list(kwargs.get('open_options', [])) + ['ENCODING={0}'.format(encoding)]
+
+        return filename, args, kwargs
+
+    prepare_dbf = prepare_shp
+
+    def prepare_geojson(self, filename, *args, **kwargs):
+        """
+        Opens large GeoJSON FeatureCollections with the GeoJSONSeq driver, which reads one feature at a time
+        instead of loading the whole document.  The sequence is written next to the file once and reused.
+        """
+        if not GEOJSON_STREAMING_SIZE or gdal.GetDriverByName('GeoJSONSeq') is None:
+            return filename, args, kwargs
+
+        if not os.path.isfile(filename) or os.path.getsize(filename) < GEOJSON_STREAMING_SIZE:
+            return filename, args, kwargs
+
+        sequence = os.path.splitext(filename)[0] + '.geojsons'
+
+        if not os.path.exists(sequence) or os.path.getmtime(sequence) < os.path.getmtime(filename):
+            try:
+                streamable = geojson_to_geojsonseq(filename, sequence)
+            except (IOError, ValueError):
+                logger.exception('Could not convert {} to a GeoJSON sequence.'.format(filename))
+                streamable = False
+
+            if not streamable:
+                return filename, args, kwargs
+
+        self.geojson_sequence = sequence
+        return sequence, args, kwargs
+
+    prepare_json = prepare_geojson
+
+    def remove_geojson_sequence(self):
+        """
+        Closes the file and removes the GeoJSON sequence it was read from, once the file was imported.
+        """
+        if self.geojson_sequence is None:
+            return
+
+        self.close()
+
+        if os.path.exists(self.geojson_sequence):
+            os.remove(self.geojson_sequence)
+
+        self.geojson_sequence = None
+
     def prepare_zip(self, filename, *args, **kwargs):
         """
         Appends '/vsizip/' to the filename path.
@@ -138,6 +218,7 @@ class GDALInspector(InspectorMixin):
         Opens the file.
         """
         filename = self.file
+        self.open_kwargs = kwargs
 
         prepare_method = 'prepare_{0}'.format(self.method_safe_filetype)
 
@@ -161,6 +242,75 @@ class GDALInspector(InspectorMixin):
 
         return self.data
 
+    def estimate_feature_count(self, layer, driver):
+        """
+        Extrapolates the number of features of a layer from the size of the file and the size of a sample of
+        its features: lines for CSV files and serialized features for other formats.  Returns None when the
+        file size does not reflect the data, e.g. for archives or files with several layers.
+        """
+        if (not os.path.isfile(self.file) or self.method_safe_filetype in ('zip', 'gz') or
+                self.data.GetLayerCount() != 1):
+            return
+
+        size = os.path.getsize(self.file)
+
+        if driver == 'CSV':
+            with open(self.file, 'rb') as f:
+                sample = f.read(1024 * 1024)
+            lines = sample.count(b'\n')
+
+            if len(sample) == size:
+                return max(lines - 1 + (not sample.endswith(b'\n')), 0)
+
+            return int(size * lines / float(len(sample))) - 1 if lines else None
+
+        sampled = sample_bytes = 0
+        layer.ResetReading()
+
+        for feature in layer:
+            sampled += 1
+            sample_bytes += len(feature.ExportToJson())
+
+            if sampled >= FEATURE_COUNT_SAMPLE_SIZE:
+                break
+
+        layer.ResetReading()
+
+        if sampled < FEATURE_COUNT_SAMPLE_SIZE:
+            return sampled
+
+        return int(size * sampled / float(sample_bytes))
+
+    def feature_count(self, layer, driver):
+        """
+        Counts the features of a layer according to FEATURE_COUNT_MODE.
+        """
+        if FEATURE_COUNT_MODE == 'exact':
+            return layer.GetFeatureCount()
+
+        count = layer.GetFeatureCount(0)
+
+        if count >= 0:
+            return count
+
+        if FEATURE_COUNT_MODE == 'estimate':
+            return self.estimate_feature_count(layer, driver)
+
+    @staticmethod
+    def describe_subdataset(layer_description):
+        """
+        Adds the size and band count of a subdataset to its description.
+        """
+        try:
+            subdataset = gdal.OpenEx(layer_description['path'])
+        except RuntimeError:
+            logger.debug('gdal.OpenEx({}) failed.'.format(layer_description['path']))
+            return layer_description
+
+        layer_description.update({'width': subdataset.RasterXSize, 'height': subdataset.RasterYSize,
+                                  'band_count': subdataset.RasterCount})
+        return layer_description
+
     @staticmethod
     def geometry_type(layer):
         """
@@ -178,6 +328,22 @@ class GDALInspector(InspectorMixin):
     def describe_fields(self):
         """
         Returns a dict of the layers with fields and field types.
+
+        Descriptions are cached by file and opening options, so validating, configuring and importing an upload
+        inspect the file once.
+        """
+        key = inspection_cache.key(self.file, self.open_kwargs)
+        description = inspection_cache.get(key)
+
+        if description is None:
+            description = self.inspect()
+            inspection_cache.set(key, description)
+
+        return description
+
+    def inspect(self):
+        """
+        Opens the file if needed and describes its layers.
         """
         opened_file = self.data
         description = []
@@ -202,7 +368,7 @@ class GDALInspector(InspectorMixin):
                                  'driver': driver,
                                  'layer_definition': None}
             if driver != 'WFS':
-                layer_description['feature_count'] = layer.GetFeatureCount()
+                layer_description['feature_count'] = self.feature_count(layer, driver)
                 layer_definition = layer.GetLayerDefn()
 
                 for i in range(layer_definition.GetFieldCount()):
@@ -239,17 +405,28 @@ class GDALInspector(InspectorMixin):
                                  'driver': driver}
             description.append(layer_description)
 
-        # Get sub layers, if present
+        # Get sub layers, if present.  They are described from the SUBDATASET_<n>_NAME/DESC metadata and only
+        # opened when imported.
+        subdatasets = []
         raster_list = opened_file.GetSubDatasets()
         for m in range(0, raster_list.__len__()):
-            layer = gdal.OpenEx(raster_list[m][0])
             layer_description = {'index': len(description),
                                  'subdataset_index': m,
                                  'path': raster_list[m][0],
+                                 'subdataset_description': raster_list[m][1],
                                  'layer_name': raster_list[m][0].split(':')[-1],
                                  'layer_type': 'raster',
                                  'raster': True, 'driver': driver}
             description.append(layer_description)
+            subdatasets.append(layer_description)
+
+        if INSPECT_SUBDATASETS and subdatasets:
+            pool = ThreadPool(min(INSPECT_SUBDATASETS_THREADS, len(subdatasets)))
+            try:
+                pool.map(self.describe_subdataset, subdatasets)
+            finally:
+                pool.close()
+                pool.join()
 
         return description
 
@@ -355,93 +532,207 @@ class OGRTruncatedConverter(OGRInspector):
         return field_schema
 
 
-class BigDateOGRFieldConverter(OGRInspector):
+def get_columns(layer_name):
+    """
+    Returns the column names of a datastore table.
+    """
+    with db.connections[settings.OSGEO_DATASTORE].cursor() as cursor:
+        cursor.execute('SELECT attname FROM pg_attribute WHERE attrelid = %s::regclass AND attnum > 0 '
+                       'AND NOT attisdropped ORDER BY attnum', (quote_ident(layer_name),))
+        return [row[0] for row in cursor.fetchall()]
 
-    def convert_field(self, layer_name, field):
-        field_as_string = str(field)
-        xd_col = '{0}_xd'.format(field).lower()
-        parsed_col = '{0}_parsed'.format(field).lower()
-        target_layer = self.data.GetLayerByName(layer_name)
 
-        # target_layer.GetLayerDefn().GetFieldIndex(parsed_col) raises errors when the field does not
-        # exist with older versions of OGR
-        while target_layer.FindFieldIndex(xd_col, 1) >= 0:
-            xd_col = increment(xd_col)
+def find_column(columns, field):
+    """
+    Returns the column named `field`, ignoring case like OGR's field lookups.
+    """
+    for column in columns:
+        if column == field:
+            return column
+
+    for column in columns:
+        if column.lower() == str(field).lower():
+            return column
 
-        while target_layer.FindFieldIndex(parsed_col, 1) >= 0:
-            parsed_col = increment(parsed_col)
+    raise KeyError('No column named "{0}".'.format(field))
 
-        target_layer.CreateField(ogr.FieldDefn(xd_col, ogr.OFTInteger64))
-        xd_col_index = target_layer.GetLayerDefn().GetFieldIndex(xd_col)
-        target_layer.CreateField(ogr.FieldDefn(parsed_col, ogr.OFTString))
-        parsed_col_index = target_layer.GetLayerDefn().GetFieldIndex(parsed_col)
 
-        for feat in target_layer:
+def unique_column_name(columns, name):
+    while name.lower() in [column.lower() for column in columns]:
+        name = increment(name)
 
-            if not feat:
-                continue
+    columns.append(name)
+    return name
 
-            string_field = feat[field_as_string]
 
-            if string_field:
-                xd, parsed = timeparse(str(string_field))
+def add_columns(layer_name, columns):
+    """
+    Adds (name, type) columns to a datastore table with one ALTER TABLE.
+    """
+    if not columns:
+        return
 
-                feat.SetField(xd_col_index, xd)
-                feat.SetField(parsed_col_index, parsed)
+    with db.connections[settings.OSGEO_DATASTORE].cursor() as cursor:
+        cursor.execute('ALTER TABLE {0} {1}'.format(quote_ident(layer_name), ', '.join(
+            'ADD COLUMN {0} {1}'.format(quote_ident(name), column_type) for name, column_type in columns)))
 
-                target_layer.SetFeature(feat)
 
-            # prevent segfaults
-            feat = None
-        conn = db.connections[settings.OSGEO_DATASTORE]
-        cursor = conn.cursor()
-        query = """
-        DO $$
-        BEGIN
-        IF NOT EXISTS (SELECT 1 FROM pg_type WHERE typname='bigdate') THEN
-        CREATE DOMAIN bigdate bigint;
-        END IF;
-        END;
-        $$;
+def get_distinct_values(layer_name, column):
+    """
+    Returns the distinct values of a column as text, leaving out the values the converters never parsed: NULL,
+    empty strings, zeros and false.
+    """
+    table = quote_ident(layer_name)
 
-        ALTER TABLE %s ALTER COLUMN %s TYPE bigdate;
-        """ % (quote_ident(layer_name), quote_ident(xd_col))
+    with db.connections[settings.OSGEO_DATASTORE].cursor() as cursor:
+        cursor.execute('SELECT format_type(atttypid, NULL) FROM pg_attribute WHERE attrelid = %s::regclass '
+                       'AND attname = %s', (table, column))
+        data_type = cursor.fetchone()[0]
+        conditions = ['{0} IS NOT NULL', "{0}::text <> ''"]
 
-        cursor.execute(query)
+        if data_type in NUMERIC_TYPES:
+            conditions.append('{0} <> 0')
+        elif data_type == 'boolean':
+            conditions.append('{0}')
 
-        return xd_col
+        cursor.execute('SELECT DISTINCT {0}::text FROM {1} WHERE {2}'.format(
+            quote_ident(column), table, ' AND '.join(conditions).format(quote_ident(column))))
+        return [row[0] for row in cursor.fetchall()]
 
 
-class OGRFieldConverter(OGRInspector):
+def update_from_values(layer_name, mappings):
     """
-    Uses dateutil.parse to parse date times.
+    Sets columns of a datastore table from mappings of the values of other columns.  `mappings` is a list of
+    (column, targets, rows) where `targets` lists the (name, type) of the columns to set and `rows` yields
+    (value, <target values>...) keyed by the text of `column`.  Each mapping is copied into a temporary table
+    and all columns are set by a single UPDATE instead of one UPDATE per feature and field.
     """
+    table = quote_ident(layer_name)
+    assignments = []
 
-    def convert_field(self, layer_name, field):
-        fieldname = '{0}_as_date'.format(field)
-        target_layer = self.data.GetLayerByName(layer_name)
+    with db.transaction.atomic(using=settings.OSGEO_DATASTORE), \
+            db.connections[settings.OSGEO_DATASTORE].cursor() as cursor:
+        for i, (column, targets, rows) in enumerate(mappings):
+            mapping_table = 'pg_temp.{0}'.format(quote_ident('{0}_values_{1}'.format(layer_name[:50], i)))
+            targets = [(quote_ident(name), column_type) for name, column_type in targets]
+            stream = StringIO()
+            writer = csv.writer(stream)
 
-        while target_layer.GetLayerDefn().GetFieldIndex(fieldname) >= 0:
-            fieldname = increment(fieldname)
+            for row in rows:
+                writer.writerow([value.encode('utf-8') if isinstance(value, unicode) else value for value in row])
 
-        target_layer.CreateField(ogr.FieldDefn(fieldname, ogr.OFTDateTime))
-        field_index = target_layer.GetLayerDefn().GetFieldIndex(fieldname)
+            stream.seek(0)
+            # A conversion inside an enclosing transaction leaves the table of a previous one behind.
+            cursor.execute('DROP TABLE IF EXISTS {0}'.format(mapping_table))
+            cursor.execute('CREATE TEMP TABLE {0} (value text PRIMARY KEY, {1}) ON COMMIT DROP'.format(
+                mapping_table, ', '.join('{0} {1}'.format(name, column_type) for name, column_type in targets)))
+            cursor.copy_expert('COPY {0} FROM STDIN WITH (FORMAT csv)'.format(mapping_table), stream)
+            cursor.execute('ANALYZE {0}'.format(mapping_table))
 
-        for feat in target_layer:
+            assignments.extend('{0} = (SELECT m.{0} FROM {1} m WHERE m.value = {2}.{3}::text)'.format(
+                name, mapping_table, table, quote_ident(column)) for name, _ in targets)
 
-            if not feat:
-                continue
+        if assignments:
+            cursor.execute('UPDATE {0} SET {1}'.format(table, ', '.join(assignments)))
 
-            string_field = feat[str(field)]
 
-            if string_field:
-                pars = parse(str(string_field))
+class FieldConverterMixin(object):
+    """
+    Converts fields of a datastore table with SQL on the datastore connection: the new columns are added by
+    one ALTER TABLE and filled by one UPDATE, no OGR datasource is opened.
+    """
 
-                feat.SetField(field_index, pars.year, pars.month, pars.day, pars.hour, pars.minute, pars.second,
-                              pars.microsecond)
+    def open(self, *args, **kwargs):
+        return self.data
+
+    def close(self, *args, **kwargs):
+        # The definitions of the table cached by pooled OGR datasources miss the new columns.
+        datasource_pool.clear(self.connection_string)
+        logger.debug('Date parse cache: {0}'.format(date_parse_cache.stats()))
+
+    def convert_field(self, layer_name, field):
+        return self.convert_fields(layer_name, [field])[field]
+
+    def convert_fields(self, layer_name, fields):
+        """
+        Returns the name of the column holding the converted values of each field.
+        """
+        raise NotImplementedError
+
+
+class BigDateOGRFieldConverter(FieldConverterMixin, OGRInspector):
+
+    def convert_fields(self, layer_name, fields):
+        """
+        Adds <field>_xd columns of big dates and <field>_parsed columns of the parsed dates.  Every distinct
+        value of a field is parsed once, in bulk.
+        """
+        with db.connections[settings.OSGEO_DATASTORE].cursor() as cursor:
+            cursor.execute("""
+            DO $$
+            BEGIN
+            IF NOT EXISTS (SELECT 1 FROM pg_type WHERE typname='bigdate') THEN
+            CREATE DOMAIN bigdate bigint;
+            END IF;
+            END;
+            $$;
+            """)
+
+        columns = get_columns(layer_name)
+        new_columns = []
+        mappings = []
+        xd_columns = {}
+
+        for field in fields:
+            source_column = find_column(columns, field)
+            xd_col = unique_column_name(columns, '{0}_xd'.format(field).lower())
+            parsed_col = unique_column_name(columns, '{0}_parsed'.format(field).lower())
+            new_columns.extend([(xd_col, 'bigdate'), (parsed_col, 'character varying')])
+            xd_columns[field] = xd_col
+
+            values = [value for value in get_distinct_values(layer_name, source_column) if value]
+            xd, parsed = timeparse_array([value.encode('utf-8') for value in values])
+            rows = [(value, t, parsed_timestr) for value, t, parsed_timestr in zip(values, xd.tolist(), parsed)
+                    if t is not None]
+            mappings.append((source_column, [(xd_col, 'bigint'), (parsed_col, 'text')], rows))
+
+        add_columns(layer_name, new_columns)
+        update_from_values(layer_name, mappings)
+
+        return xd_columns
+
+
+class OGRFieldConverter(FieldConverterMixin, OGRInspector):
+    """
+    Uses dateutil.parse to parse date times.
+    """
+
+    @staticmethod
+    def parse_values(values):
+        """
+        Returns (value, timestamp) pairs for the distinct values of a column.
+        """
+        for value in values:
+            if value:
+                pars = parse_date(value.encode('utf-8'))
+                yield value, pars.replace(tzinfo=None).isoformat()
+
+    def convert_fields(self, layer_name, fields):
+        """
+        Adds <field>_as_date columns holding the parsed values of the fields.  Every distinct value of a field is
+        parsed once.
+        """
+        columns = get_columns(layer_name)
+        new_columns = {}
+        mappings = []
 
-                target_layer.SetFeature(feat)
+        for field in fields:
+            source_column = find_column(columns, field)
+            new_columns[field] = unique_column_name(columns, '{0}_as_date'.format(field).lower())
+            rows = list(self.parse_values(get_distinct_values(layer_name, source_column)))
+            mappings.append((source_column, [(new_columns[field], 'timestamp')], rows))
 
-            feat = None
+        add_columns(layer_name, [(new_columns[field], 'timestamp with time zone') for field in fields])
+        update_from_values(layer_name, mappings)
 
-        return fieldname
+        return new_columns
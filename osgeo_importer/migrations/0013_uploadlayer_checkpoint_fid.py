@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('osgeo_importer', '0012_uploadlayer_internal_layer_name'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadlayer',
+            name='checkpoint_fid',
+            field=models.BigIntegerField(null=True, blank=True),
+        ),
+    ]
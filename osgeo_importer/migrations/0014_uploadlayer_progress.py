@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('osgeo_importer', '0013_uploadlayer_checkpoint_fid'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadlayer',
+            name='features_processed',
+            field=models.BigIntegerField(null=True, blank=True),
+        ),
+        migrations.AddField(
+            model_name='uploadlayer',
+            name='bytes_read',
+            field=models.BigIntegerField(null=True, blank=True),
+        ),
+        migrations.AddField(
+            model_name='uploadlayer',
+            name='import_stage',
+            field=models.CharField(max_length=64, null=True, blank=True),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import jsonfield.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('osgeo_importer', '0014_uploadlayer_progress'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InspectionResult',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('path', models.CharField(max_length=1000, db_index=True)),
+                ('size', models.BigIntegerField()),
+                ('mtime', models.FloatField()),
+                ('options', models.TextField(blank=True)),
+                ('content_hash', models.CharField(max_length=32, blank=True)),
+                ('description', jsonfield.fields.JSONField(null=True)),
+                ('date', models.DateTimeField(auto_now=True, verbose_name=b'date')),
+            ],
+        ),
+    ]
@@ -192,6 +192,8 @@ class UploadFile(models.Model):
         super(UploadFile, self).save(*args, **kwargs)
 
     def delete(self, *args, **kwargs):
+        if self.file:
+            InspectionResult.objects.filter(path=os.path.abspath(self.file.path)).delete()
         self.file.delete(False)
         super(UploadFile, self).delete(*args, **kwargs)
 
@@ -217,6 +219,13 @@ class UploadLayer(models.Model):
     # Geonode-wide unique name for layer.
     layer_name = models.CharField(max_length=64, null=True)
     layer_type = models.CharField(max_length=10, null=True)
+    # Source FID of the last feature committed to the target table, an interrupted import resumes after it.
+    checkpoint_fid = models.BigIntegerField(null=True, blank=True)
+    # Progress of the running import, published by the importer at most every few features or seconds.
+    features_processed = models.BigIntegerField(null=True, blank=True)
+    # Estimated from the size of the source file and the share of the features processed.
+    bytes_read = models.BigIntegerField(null=True, blank=True)
+    import_stage = models.CharField(max_length=64, null=True, blank=True)
 
     @property
     def file_name(self):
@@ -310,3 +319,17 @@ class MapProxyCacheConfig(models.Model):
     # Location of the file this config is for
     gpkg_filepath = models.CharField(max_length=1000)
     config = models.TextField()
+
+
+class InspectionResult(models.Model):
+    """ Describes the layers of a file as returned by an inspector, shared across processes by the inspection cache.
+    """
+    path = models.CharField(max_length=1000, db_index=True)
+    size = models.BigIntegerField()
+    mtime = models.FloatField()
+    # Opening options of the inspector, serialized as JSON.
+    options = models.TextField(blank=True)
+    # md5 digest of the file's contents, if the cache hashes files.
+    content_hash = models.CharField(max_length=32, blank=True)
+    description = JSONField(null=True)
+    date = models.DateTimeField('date', auto_now=True)
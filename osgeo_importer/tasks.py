@@ -1,7 +1,10 @@
+import copy
 import os
+import resource
 import shutil
 from osgeo_importer.models import UploadFile
 import celery
+from celery.exceptions import SoftTimeLimitExceeded
 from osgeo_importer.views import OSGEO_IMPORTER
 import logging
 from geonode.celery_app import app
@@ -62,6 +65,15 @@ try:
 except AttributeError:
     import_task_soft_time_limit = 90
 
+try:
+    import_task_max_retries = settings.IMPORT_TASK_MAX_RETRIES
+except AttributeError:
+    import_task_max_retries = 3
+
+# Import stages an import interrupted by the soft time limit is retried from: nothing was loaded yet or the copy
+# resumes after its last checkpoint.  The steps after the copy and the handlers are not repeatable.
+RESUMABLE_IMPORT_STAGES = (None, 'copy_features')
+
 
 @app.task(base=RecordImportStateTask, soft_time_limit=import_task_soft_time_limit, bind=True)
 def import_object(self, upload_file_id, configuration_options=None, request_cookies=None, request_user=None):
@@ -80,14 +92,37 @@ def import_object(self, upload_file_id, configuration_options=None, request_cook
         raise
     ul.task_id = self.request.id
     ul.import_status = 'PENDING'
+    ul.import_stage = None
     ul.save()
 
     upload_file = UploadFile.objects.get(id=upload_file_id)
 
     logger.info('Creating importer')
     gi = OSGEO_IMPORTER(upload_file.file.path, upload_file=upload_file)
+    # The importer adds to the configuration options, a retry starts from the options the task was called with.
+    task_options = copy.deepcopy(configuration_options)
+
     logger.info('Calling importer.handle()')
-    gi.handle(configuration_options=configuration_options, request_cookies=request_cookies, request_user=request_user)
+    try:
+        gi.handle(configuration_options=configuration_options, request_cookies=request_cookies,
+                  request_user=request_user)
+    except SoftTimeLimitExceeded as e:
+        import_stage = UploadLayer.objects.filter(id=ulid).values_list('import_stage', flat=True).first()
+
+        if import_stage not in RESUMABLE_IMPORT_STAGES:
+            logger.error('Import of layer "{}" hit the soft time limit in stage {}, which cannot be resumed'.format(
+                ul.layer_name, import_stage))
+            raise
+
+        # Continue from the last checkpointed feature instead of failing the whole import.
+        logger.info('Import of layer "{}" hit the soft time limit, retrying'.format(ul.layer_name))
+        task_options['resume'] = True
+        raise self.retry(exc=e, countdown=0, max_retries=import_task_max_retries,
+                         kwargs=dict(self.request.kwargs, configuration_options=task_options))
+    finally:
+        # ru_maxrss is in kilobytes on Linux and covers every task the worker process ran so far, not just this one.
+        logger.info('import_object() task {} for layer "{}": peak memory of the worker process since it started '
+                    '{} kB'.format(self.request.id, ul.layer_name, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss))
     return
 
 
@@ -1,21 +1,117 @@
+import json
 import os
 import shutil
+import tempfile
 
+from celery.exceptions import SoftTimeLimitExceeded
 from django.contrib.auth import get_user_model
 from django.db import connections
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase
+import mock
+import ogr
+import osr
 
 from osgeo_importer.importers import OGRImport
+from osgeo_importer.inspectors import GDALInspector
 from osgeo_importer.tests.test_settings import _TEST_FILES_DIR
-from osgeo_importer.utils import ImportHelper
+from osgeo_importer.utils import ImportHelper, get_attribute_statistics
+from osgeo_importer.writers import CSVCopyWriter, OGRFeatureWriter, ParallelCopyWriter, VectorTranslateWriter
 
 User = get_user_model()
 
 
-class OGRImportTests(ImportHelper, TestCase,):
+class ImportTestMixin(ImportHelper):
+    """ Uploads test files for the import tests.
+    """
     def setUp(self):
         self.admin_user = User.objects.create_superuser(username='admin', password='admin', email='')
 
+    def upload_test_file(self, test_filename):
+        """ Uploads & configures a copy of *test_filename*, returns its first UploadFile & UploadLayer.
+        """
+        test_filepath = os.path.join(_TEST_FILES_DIR, test_filename)
+
+        # Make temporary file (the upload/configure process removes the file & we want to keep our test file)
+        tmppath = os.path.join('/tmp', test_filename)
+        shutil.copyfile(test_filepath, tmppath)
+
+        # upload & configure_upload expect closed file objects
+        of = open(tmppath, 'rb')
+        of.close()
+        files = [of]
+        upload = self.upload(files, self.admin_user)
+        self.configure_upload(upload, files)
+
+        upload_file = upload.uploadfile_set.first()
+        upload_layer = upload_file.uploadlayer_set.first()
+        return upload_file, upload_layer
+
+    def upload_paths(self, paths):
+        """ Uploads & configures the files at *paths*, returns the first UploadFile & UploadLayer.
+        """
+        # upload & configure_upload expect closed file objects
+        files = []
+        for path in paths:
+            of = open(path, 'rb')
+            of.close()
+            files.append(of)
+        upload = self.upload(files, self.admin_user)
+        self.configure_upload(upload, files)
+
+        upload_layer = upload.uploadlayer_set.first()
+        return upload_layer.upload_file, upload_layer
+
+    def upload_test_shapefile(self, name, geom_type, wkts, srs=None):
+        """ Writes a shapefile holding the geometries of *wkts* to a temporary directory, uploads & configures it,
+            returns its UploadFile & UploadLayer.
+        """
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir, True)
+
+        datasource = ogr.GetDriverByName('ESRI Shapefile').CreateDataSource(os.path.join(tmpdir, name + '.shp'))
+        layer = datasource.CreateLayer(name, srs, geom_type)
+        layer.CreateField(ogr.FieldDefn('name', ogr.OFTString))
+
+        for i, wkt in enumerate(wkts):
+            feature = ogr.Feature(layer.GetLayerDefn())
+            feature.SetField('name', 'feature {}'.format(i))
+            feature.SetGeometry(ogr.CreateGeometryFromWkt(wkt))
+            layer.CreateFeature(feature)
+
+        # Closing the datasource writes the files.
+        layer = datasource = None
+        return self.upload_paths([os.path.join(tmpdir, part) for part in sorted(os.listdir(tmpdir))])
+
+    def assert_features_imported(self, oi, layer_name, layer_config):
+        """ Checks that the table of *layer_name* holds every source feature with a geometry, with the values of
+            its integer, real & string fields and its FID when the source has a FID column.  Returns the FIDs of
+            the source features.
+        """
+        data, _ = oi.open_source_datastore(oi.file)
+        layer = data.GetLayer(layer_config.get('index', 0))
+        definition = layer.GetLayerDefn()
+        fields = [definition.GetFieldDefn(i).GetName() for i in range(definition.GetFieldCount())
+                  if definition.GetFieldDefn(i).GetType() in (ogr.OFTInteger, ogr.OFTReal, ogr.OFTString)]
+        expected = [[feature.GetFID()] + [feature.GetField(field) for field in fields]
+                    for feature in layer if feature.geometry()]
+        columns = [layer_config['modified_fields'].get(field, field) for field in fields]
+
+        with connections['datastore'].cursor() as cursor:
+            cursor.execute('SELECT ogc_fid, {0} FROM "{1}";'.format(
+                ', '.join('"{}"'.format(column) for column in columns), layer_name))
+            loaded = [list(row) for row in cursor.fetchall()]
+
+        fids = [row[0] for row in expected]
+        if not layer.GetFIDColumn():
+            # The target numbers the features with its own sequence.
+            expected = [row[1:] for row in expected]
+            loaded = [row[1:] for row in loaded]
+
+        self.assertEqual(sorted(loaded), sorted(expected))
+        return fids
+
+
+class OGRImportTests(ImportTestMixin, TestCase):
     def test_import_file_uses_uploadlayer_layername(self):
         """ Checks that the unique layer name created by configure_upload() & stored in UploadLayer is used
             as the table name for data stored in PostGIS.
@@ -166,3 +262,457 @@ class OGRImportTests(ImportHelper, TestCase,):
             cursor.execute(sql)
             tables = [row[0] for row in cursor.fetchall()]
             self.assertIn(expected_tablename, tables)
+
+    def test_import_file_batched_transactions(self):
+        """ Checks that every feature is written when features are committed in batches smaller than the layer.
+        """
+        upload_file, upload_layer = self.upload_test_file('my_states.gpkg')
+
+        configuration_options = {'upload_layer_id': upload_layer.id, 'index': 0}
+        oi = OGRImport(upload_file.file.name, upload_file=upload_file)
+        oi.transaction_size = 7
+        # Go through the feature writer, VectorTranslate would load the GeoPackage on its own.
+        oi.vector_translate = False
+        layers = oi.import_file(configuration_options=configuration_options)
+
+        with connections['datastore'].cursor() as cursor:
+            cursor.execute('SELECT count(*) FROM "{}";'.format(layers[0][0]))
+            self.assertEqual(cursor.fetchone()[0], upload_layer.feature_count)
+
+    def test_import_file_vector_translate(self):
+        """ Checks that layers needing no per-feature fixups are loaded by VectorTranslate with their FIDs and
+            field values.
+        """
+        upload_file, upload_layer = self.upload_test_file('my_states.gpkg')
+
+        configuration_options = {'upload_layer_id': upload_layer.id, 'index': 0}
+        oi = OGRImport(upload_file.file.name, upload_file=upload_file)
+        oi.vector_translate = True
+
+        with mock.patch.object(VectorTranslateWriter, 'write', autospec=True,
+                               side_effect=VectorTranslateWriter.write) as write:
+            layer_name, layer_config = oi.import_file(configuration_options=configuration_options)[0]
+
+        self.assertEqual(write.call_count, 1)
+        fids = self.assert_features_imported(oi, layer_name, layer_config)
+        upload_layer.refresh_from_db()
+        self.assertEqual(upload_layer.feature_count, len(fids))
+
+    def test_import_file_promotes_mixed_geometries(self):
+        """ Checks that a shapefile mixing Polygons & MultiPolygons is loaded into a MultiPolygon column without
+            losing any feature or part.
+        """
+        upload_file, upload_layer = self.upload_test_shapefile('mixed_polygons', ogr.wkbPolygon, [
+            'POLYGON ((0 0, 1 0, 1 1, 0 0))',
+            'MULTIPOLYGON (((2 2, 3 2, 3 3, 2 2)), ((4 4, 5 4, 5 5, 4 4)))',
+            'POLYGON ((6 6, 7 6, 7 7, 6 6))',
+        ])
+
+        configuration_options = {'upload_layer_id': upload_layer.id, 'index': 0}
+        oi = OGRImport(upload_file.file.name, upload_file=upload_file)
+        layer_name = oi.import_file(configuration_options=configuration_options)[0][0]
+
+        with connections['datastore'].cursor() as cursor:
+            cursor.execute('SELECT type FROM geometry_columns WHERE f_table_name = %s;', (layer_name,))
+            self.assertEqual(cursor.fetchone()[0], 'MULTIPOLYGON')
+            cursor.execute('SELECT count(*), sum(ST_NumGeometries(wkb_geometry)) FROM "{}";'.format(layer_name))
+            self.assertEqual(cursor.fetchone(), (3, 4))
+
+    def test_import_file_keeps_declared_geometry_type(self):
+        """ Checks that a shapefile whose features all match its declared geometry type is loaded into a column of
+            that type without altering it after the load.
+        """
+        upload_file, upload_layer = self.upload_test_shapefile('single_polygons', ogr.wkbPolygon, [
+            'POLYGON ((0 0, 1 0, 1 1, 0 0))',
+            'POLYGON ((6 6, 7 6, 7 7, 6 6))',
+        ])
+
+        configuration_options = {'upload_layer_id': upload_layer.id, 'index': 0}
+        oi = OGRImport(upload_file.file.name, upload_file=upload_file)
+
+        with mock.patch.object(OGRImport, 'set_geometry_type', autospec=True,
+                               side_effect=OGRImport.set_geometry_type) as set_geometry_type:
+            layer_name = oi.import_file(configuration_options=configuration_options)[0][0]
+
+        self.assertEqual(set_geometry_type.call_count, 0)
+        with connections['datastore'].cursor() as cursor:
+            cursor.execute('SELECT type FROM geometry_columns WHERE f_table_name = %s;', (layer_name,))
+            self.assertEqual(cursor.fetchone()[0], 'POLYGON')
+            cursor.execute('SELECT count(*) FROM "{}";'.format(layer_name))
+            self.assertEqual(cursor.fetchone()[0], 2)
+
+    def test_import_file_keeps_identified_srs(self):
+        """ Checks that a layer in a projection with an EPSG code is loaded in that projection, unchanged.
+        """
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir, True)
+        path = os.path.join(tmpdir, 'utm_points.geojson')
+
+        with open(path, 'w') as f:
+            json.dump({
+                'type': 'FeatureCollection',
+                'crs': {'type': 'name', 'properties': {'name': 'urn:ogc:def:crs:EPSG::32615'}},
+                'features': [{'type': 'Feature', 'properties': {'name': 'a'},
+                              'geometry': {'type': 'Point', 'coordinates': [500000.0, 4649776.0]}}],
+            }, f)
+
+        upload_file, upload_layer = self.upload_paths([path])
+        configuration_options = {'upload_layer_id': upload_layer.id, 'index': 0}
+        oi = OGRImport(upload_file.file.name, upload_file=upload_file)
+        layer_name, layer_config = oi.import_file(configuration_options=configuration_options)[0]
+
+        self.assertEqual(layer_config['srs'], 'EPSG:32615')
+        with connections['datastore'].cursor() as cursor:
+            cursor.execute('SELECT ST_SRID(wkb_geometry), ST_X(wkb_geometry), ST_Y(wkb_geometry) FROM "{}";'
+                           .format(layer_name))
+            self.assertEqual(cursor.fetchone(), (32615, 500000.0, 4649776.0))
+
+    def test_import_file_reprojects_unidentified_srs(self):
+        """ Checks that a layer in a projection without an EPSG code is reprojected to EPSG:4326 while it is loaded.
+        """
+        srs = osr.SpatialReference()
+        srs.ImportFromProj4('+proj=lcc +lat_1=33 +lat_2=45 +lat_0=39 +lon_0=-96 +x_0=0 +y_0=0 +datum=WGS84 +units=m')
+        upload_file, upload_layer = self.upload_test_shapefile('lcc_points', ogr.wkbPoint, [
+            'POINT (100000 200000)',
+            'POINT (-250000 -50000)',
+        ], srs=srs)
+
+        configuration_options = {'upload_layer_id': upload_layer.id, 'index': 0}
+        oi = OGRImport(upload_file.file.name, upload_file=upload_file)
+        layer_name, layer_config = oi.import_file(configuration_options=configuration_options)[0]
+
+        target_srs = osr.SpatialReference()
+        target_srs.ImportFromEPSG(4326)
+        transform = OGRImport.get_coordinate_transformation(srs, target_srs)
+        expected = [transform.TransformPoint(100000, 200000)[:2], transform.TransformPoint(-250000, -50000)[:2]]
+
+        self.assertEqual(layer_config['srs'], 'EPSG:4326')
+        with connections['datastore'].cursor() as cursor:
+            cursor.execute('SELECT ST_SRID(wkb_geometry), ST_X(wkb_geometry), ST_Y(wkb_geometry) FROM "{}" '
+                           'ORDER BY name;'.format(layer_name))
+            rows = cursor.fetchall()
+
+        self.assertEqual([row[0] for row in rows], [4326, 4326])
+        for row, (x, y) in zip(rows, expected):
+            self.assertAlmostEqual(row[1], x, places=6)
+            self.assertAlmostEqual(row[2], y, places=6)
+
+    def test_import_file_uses_inspection_cache(self):
+        """ Checks that import_file reuses the description cached by configure_upload() instead of inspecting the
+            file again.
+        """
+        upload_file, upload_layer = self.upload_test_file('my_states.gpkg')
+
+        configuration_options = {'upload_layer_id': upload_layer.id, 'index': 0}
+        oi = OGRImport(upload_file.file.name, upload_file=upload_file)
+
+        with mock.patch.object(GDALInspector, 'inspect', autospec=True, side_effect=GDALInspector.inspect) as inspect:
+            oi.import_file(configuration_options=configuration_options)
+
+        self.assertEqual(inspect.call_count, 0)
+
+    def test_import_file_builds_spatial_index(self):
+        """ Checks that the spatial index is built after the load and the timings are reported.
+        """
+        upload_file, upload_layer = self.upload_test_file('my_states.gpkg')
+
+        configuration_options = {'upload_layer_id': upload_layer.id, 'index': 0}
+        oi = OGRImport(upload_file.file.name, upload_file=upload_file)
+        layer_name, layer_config = oi.import_file(configuration_options=configuration_options)[0]
+
+        with connections['datastore'].cursor() as cursor:
+            cursor.execute("SELECT indexdef FROM pg_indexes WHERE tablename = %s AND indexdef LIKE '%%USING gist%%';",
+                           (layer_name,))
+            self.assertEqual(len(cursor.fetchall()), 1)
+
+        self.assertIn('create_spatial_index', layer_config['timings'])
+        oi.enabled_handlers = []
+        handler_results = oi.run_import_handlers(layer_name, layer_config)
+        self.assertIn('create_spatial_index', handler_results[0]['OGRImport'])
+
+    def test_import_file_unlogged_staging(self):
+        """ Checks that layers are loaded into an UNLOGGED staging table that is moved into place by the handlers.
+        """
+        upload_file, upload_layer = self.upload_test_file('my_states.gpkg')
+
+        configuration_options = {'upload_layer_id': upload_layer.id, 'index': 0}
+        oi = OGRImport(upload_file.file.name, upload_file=upload_file)
+        oi.unlogged_staging = True
+        layer_name, layer_config = oi.import_file(configuration_options=configuration_options)[0]
+        staging_table = layer_config['staging_table']
+
+        sql = 'SELECT relpersistence FROM pg_class WHERE relname = %s;'
+        with connections['datastore'].cursor() as cursor:
+            cursor.execute(sql, (staging_table,))
+            self.assertEqual(cursor.fetchone()[0], 'u')
+
+            oi.enabled_handlers = []
+            oi.run_import_handlers(layer_name, layer_config)
+            self.assertNotIn('staging_table', layer_config)
+
+            cursor.execute(sql, (layer_name,))
+            self.assertEqual(cursor.fetchone()[0], 'p')
+            cursor.execute(sql, (staging_table,))
+            self.assertIsNone(cursor.fetchone())
+
+    def test_import_file_resumes_after_checkpoint(self):
+        """ Checks that a resumed import only copies the features after the checkpointed FID.
+        """
+        upload_file, upload_layer = self.upload_test_file('my_states.gpkg')
+
+        configuration_options = {'upload_layer_id': upload_layer.id, 'index': 0}
+        oi = OGRImport(upload_file.file.name, upload_file=upload_file)
+        oi.transaction_size = 7
+        oi.vector_translate = False
+        layer_name = oi.import_file(configuration_options=configuration_options)[0][0]
+        upload_layer.refresh_from_db()
+        self.assertIsNotNone(upload_layer.checkpoint_fid)
+
+        # Simulate an import interrupted after the 10th feature.
+        upload_layer.checkpoint_fid = 10
+        upload_layer.save()
+        with connections['datastore'].cursor() as cursor:
+            cursor.execute('DELETE FROM "{}" WHERE ogc_fid > 10;'.format(layer_name))
+
+        configuration_options = {'upload_layer_id': upload_layer.id, 'index': 0, 'resume': True}
+        oi = OGRImport(upload_file.file.name, upload_file=upload_file)
+        oi.import_file(configuration_options=configuration_options)
+
+        with connections['datastore'].cursor() as cursor:
+            cursor.execute('SELECT count(*) FROM "{}";'.format(layer_name))
+            self.assertEqual(cursor.fetchone()[0], upload_layer.feature_count)
+
+    def test_import_file_retry_resumes_after_vector_translate(self):
+        """ Checks that a retry of an import interrupted in VectorTranslate copies with a checkpointing writer,
+            so the next retry resumes after the checkpoint instead of starting over.
+        """
+        upload_file, upload_layer = self.upload_test_file('my_states.gpkg')
+
+        configuration_options = {'upload_layer_id': upload_layer.id, 'index': 0}
+        oi = OGRImport(upload_file.file.name, upload_file=upload_file)
+        oi.vector_translate = True
+
+        with mock.patch.object(VectorTranslateWriter, 'write', autospec=True, side_effect=SoftTimeLimitExceeded):
+            with self.assertRaises(SoftTimeLimitExceeded):
+                oi.import_file(configuration_options=configuration_options)
+
+        upload_layer.refresh_from_db()
+        self.assertIsNone(upload_layer.checkpoint_fid)
+
+        source_counts = []
+
+        def write(writer, layer, *args, **kwargs):
+            source_counts.append(layer.GetFeatureCount())
+            return OGRFeatureWriter.write(writer, layer, *args, **kwargs)
+
+        configuration_options = {'upload_layer_id': upload_layer.id, 'index': 0, 'resume': True}
+        oi = OGRImport(upload_file.file.name, upload_file=upload_file)
+        oi.vector_translate = True
+        oi.transaction_size = 7
+
+        with mock.patch.object(VectorTranslateWriter, 'write', autospec=True) as vector_translate_write:
+            with mock.patch.object(OGRFeatureWriter, 'write', autospec=True, side_effect=write):
+                layer_name = oi.import_file(configuration_options=configuration_options)[0][0]
+
+        self.assertEqual(vector_translate_write.call_count, 0)
+        upload_layer.refresh_from_db()
+        self.assertIsNotNone(upload_layer.checkpoint_fid)
+        feature_count = upload_layer.feature_count
+        self.assertEqual(source_counts, [feature_count])
+
+        # Simulate the retry being interrupted after the 10th feature.
+        upload_layer.checkpoint_fid = 10
+        upload_layer.save()
+        with connections['datastore'].cursor() as cursor:
+            cursor.execute('DELETE FROM "{}" WHERE ogc_fid > 10;'.format(layer_name))
+
+        oi = OGRImport(upload_file.file.name, upload_file=upload_file)
+        oi.vector_translate = True
+
+        with mock.patch.object(OGRFeatureWriter, 'write', autospec=True, side_effect=write):
+            oi.import_file(configuration_options=configuration_options)
+
+        self.assertEqual(source_counts, [feature_count, feature_count - 10])
+        with connections['datastore'].cursor() as cursor:
+            cursor.execute('SELECT count(*) FROM "{}";'.format(layer_name))
+            self.assertEqual(cursor.fetchone()[0], feature_count)
+
+    def test_import_file_unordered_fids_not_checkpointed(self):
+        """ Checks that no checkpoint is kept when the source FIDs are not ascending, a resumed import would skip
+            the features read after a higher FID.
+        """
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir, True)
+        path = os.path.join(tmpdir, 'unordered_ids.geojson')
+
+        with open(path, 'w') as f:
+            json.dump({'type': 'FeatureCollection', 'features': [
+                {'type': 'Feature', 'id': fid, 'properties': {'name': str(fid)},
+                 'geometry': {'type': 'Point', 'coordinates': [fid, fid]}} for fid in (5, 6, 1, 2)
+            ]}, f)
+
+        upload_file, upload_layer = self.upload_paths([path])
+        configuration_options = {'upload_layer_id': upload_layer.id, 'index': 0}
+        oi = OGRImport(upload_file.file.name, upload_file=upload_file)
+        oi.transaction_size = 1
+        oi.vector_translate = False
+        oi.import_file(configuration_options=configuration_options)
+
+        upload_layer.refresh_from_db()
+        self.assertIsNone(upload_layer.checkpoint_fid)
+        self.assertEqual(upload_layer.feature_count, 4)
+
+    def test_import_file_postgres_copy_writer(self):
+        """ Checks that the COPY writer loads every feature with its attribute values and source FID and
+            checkpoints the FID of the last feature.
+        """
+        upload_file, upload_layer = self.upload_test_file('my_states.gpkg')
+
+        configuration_options = {'upload_layer_id': upload_layer.id, 'index': 0}
+        oi = OGRImport(upload_file.file.name, upload_file=upload_file)
+        oi.feature_writer = 'osgeo_importer.writers.PostgresCopyWriter'
+        oi.vector_translate = False
+        oi.transaction_size = 7
+        layer_name, layer_config = oi.import_file(configuration_options=configuration_options)[0]
+
+        fids = self.assert_features_imported(oi, layer_name, layer_config)
+        upload_layer.refresh_from_db()
+        self.assertEqual(upload_layer.checkpoint_fid, max(fids))
+
+    def test_import_file_csv_copy(self):
+        """ Checks that the CSV loader builds a row with a geometry for every CSV record with a location.
+        """
+        upload_file, upload_layer = self.upload_test_file('US_Shootings.csv')
+
+        configuration_options = {'upload_layer_id': upload_layer.id, 'index': 0}
+        oi = OGRImport(upload_file.file.name, upload_file=upload_file)
+        oi.csv_copy = True
+        data, _ = oi.open_source_datastore(upload_file.file.name)
+        expected = len([f for f in data.GetLayer(0) if f.geometry()])
+
+        with mock.patch.object(CSVCopyWriter, 'write', autospec=True, side_effect=CSVCopyWriter.write) as write:
+            layer_name = oi.import_file(configuration_options=configuration_options)[0][0]
+
+        self.assertEqual(write.call_count, 1)
+        with connections['datastore'].cursor() as cursor:
+            cursor.execute('SELECT count(wkb_geometry) FROM "{}";'.format(layer_name))
+            self.assertEqual(cursor.fetchone()[0], expected)
+
+    def test_import_file_csv_copy_values(self):
+        """ Checks that the CSV loader stores the values of every CSV record and builds its point.
+        """
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir, True)
+        path = os.path.join(tmpdir, 'csv_points.csv')
+
+        with open(path, 'w') as f:
+            f.write('name,category,lon,lat\n'
+                    'alpha,one,1.5,2.5\n'
+                    'beta,"two, three",-3.25,4\n'
+                    'gamma,four,5,-6.75\n')
+
+        upload_file, upload_layer = self.upload_paths([path])
+        configuration_options = {'upload_layer_id': upload_layer.id, 'index': 0}
+        oi = OGRImport(upload_file.file.name, upload_file=upload_file)
+        oi.csv_copy = True
+
+        with mock.patch.object(CSVCopyWriter, 'write', autospec=True, side_effect=CSVCopyWriter.write) as write:
+            layer_name, layer_config = oi.import_file(configuration_options=configuration_options)[0]
+
+        self.assertEqual(write.call_count, 1)
+        self.assert_features_imported(oi, layer_name, layer_config)
+
+        with connections['datastore'].cursor() as cursor:
+            cursor.execute('SELECT ST_X(wkb_geometry), ST_Y(wkb_geometry) FROM "{}";'.format(layer_name))
+            self.assertEqual(sorted(cursor.fetchall()), [(-3.25, 4.0), (1.5, 2.5), (5.0, -6.75)])
+
+    def test_get_attribute_statistics(self):
+        """ Checks that the attribute statistics of an imported layer account for every row.
+        """
+        upload_file, upload_layer = self.upload_test_file('US_Shootings.csv')
+
+        configuration_options = {'upload_layer_id': upload_layer.id, 'index': 0}
+        oi = OGRImport(upload_file.file.name, upload_file=upload_file)
+        layer_name = oi.import_file(configuration_options=configuration_options)[0][0]
+
+        with connections['datastore'].cursor() as cursor:
+            cursor.execute('SELECT * FROM "{}" LIMIT 0;'.format(layer_name))
+            fields = [column[0] for column in cursor.description if column[0] != 'wkb_geometry']
+            cursor.execute('SELECT count(*) FROM "{}";'.format(layer_name))
+            rows = cursor.fetchone()[0]
+
+        statistics = get_attribute_statistics(layer_name, fields, unique_values_limit=5)
+
+        self.assertTrue(statistics)
+        for field, field_statistics in statistics.items():
+            self.assertIn(field, fields)
+            self.assertEqual(field_statistics['Count'] + field_statistics['NullCount'], rows)
+
+    def test_get_attribute_statistics_renamed_fields(self):
+        """ Checks that the statistics of attributes are read from the columns they are mapped to and that only
+            fields with few distinct values list them.
+        """
+        upload_file, upload_layer = self.upload_test_shapefile(
+            'statistics_points', ogr.wkbPoint, ['POINT ({0} {0})'.format(i) for i in range(3)])
+        configuration_options = {'upload_layer_id': upload_layer.id, 'index': 0}
+        oi = OGRImport(upload_file.file.name, upload_file=upload_file)
+        layer_name = oi.import_file(configuration_options=configuration_options)[0][0]
+
+        statistics = get_attribute_statistics(layer_name, {'Name': 'name', 'Missing': 'missing'},
+                                              unique_values_limit=3)
+        self.assertEqual(statistics.keys(), ['Name'])
+        self.assertEqual(statistics['Name']['Count'], 3)
+        self.assertEqual(json.loads(statistics['Name']['unique_values']),
+                         ['feature 0', 'feature 1', 'feature 2'])
+
+        statistics = get_attribute_statistics(layer_name, {'Name': 'name'}, unique_values_limit=2)
+        self.assertEqual(statistics['Name']['unique_values'], 'NA')
+
+
+class ParallelCopyTests(ImportTestMixin, TransactionTestCase):
+    """ The parallel copy closes the database connections before forking its workers, which would end the
+        transaction a TestCase runs in.
+    """
+    def upload_points(self):
+        upload_file, upload_layer = self.upload_test_shapefile(
+            'parallel_points', ogr.wkbPoint, ['POINT ({0} {0})'.format(i) for i in range(10)])
+        oi = OGRImport(upload_file.file.name, upload_file=upload_file)
+        oi.parallel_copy_processes = 2
+        oi.parallel_copy_min_features = 1
+        return oi, upload_layer
+
+    def test_import_file_parallel_copy(self):
+        """ Checks that every feature is written when the layer is copied in ranges by several processes.
+        """
+        oi, upload_layer = self.upload_points()
+        configuration_options = {'upload_layer_id': upload_layer.id, 'index': 0}
+
+        with mock.patch.object(ParallelCopyWriter, 'write', autospec=True,
+                               side_effect=ParallelCopyWriter.write) as write:
+            layer_name, layer_config = oi.import_file(configuration_options=configuration_options)[0]
+
+        self.assertEqual(write.call_count, 1)
+        self.assert_features_imported(oi, layer_name, layer_config)
+        upload_layer.refresh_from_db()
+        self.assertEqual(upload_layer.feature_count, 10)
+
+    def test_import_file_parallel_copy_failure(self):
+        """ Checks that the error of a failed worker is raised and the ranges copied by the others are removed.
+        """
+        oi, upload_layer = self.upload_points()
+        configuration_options = {'upload_layer_id': upload_layer.id, 'index': 0}
+        write = OGRFeatureWriter.write
+
+        # Forked workers inherit the patched writer.
+        def fail_after_first_range(writer, layer, *args, **kwargs):
+            if layer.start > 0:
+                raise RuntimeError('Range starting at {} failed'.format(layer.start))
+            return write(writer, layer, *args, **kwargs)
+
+        with mock.patch.object(OGRFeatureWriter, 'write', fail_after_first_range):
+            with self.assertRaises(RuntimeError):
+                oi.import_file(configuration_options=configuration_options)
+
+        with connections['datastore'].cursor() as cursor:
+            cursor.execute('SELECT count(*) FROM "{}";'.format(upload_layer.layer_name))
+            self.assertEqual(cursor.fetchone()[0], 0)
@@ -1,5 +1,17 @@
-from django.test import SimpleTestCase
-from osgeo_importer.inspectors import OGRInspector, GDALInspector
+import json
+import os
+import shutil
+import tempfile
+import threading
+from unittest import skipUnless
+
+from django.db import connections
+from django.test import SimpleTestCase, TestCase
+import gdal
+import mock
+from osgeo_importer.inspectors import (
+    OGRFieldConverter, OGRInspector, GDALInspector, find_column, get_distinct_values, unique_column_name
+)
 from osgeo_importer.utils import NoDataSourceFound
 import logging
 
@@ -26,3 +38,104 @@ class TestOGRInspector(SimpleTestCase):
 class TestGDALInspector(SimpleTestCase):
     def test_open_bad_connection(self):
         check_inspector_open_bad_connection(self, GDALInspector)
+
+    def test_estimate_feature_count(self):
+        tmpdir = tempfile.mkdtemp()
+        path = os.path.join(tmpdir, 'points.csv')
+
+        try:
+            with open(path, 'w') as f:
+                f.write('x,y\n' + ''.join('{0},{0}\n'.format(i) for i in range(10)))
+
+            inspector = GDALInspector(path)
+            layer = inspector.open().GetLayer(0)
+            self.assertEqual(inspector.estimate_feature_count(layer, 'CSV'), 10)
+            self.assertEqual(inspector.feature_count(layer, 'CSV'), 10)
+            inspector.close()
+        finally:
+            shutil.rmtree(tmpdir)
+
+    @skipUnless(gdal.GetDriverByName('GeoJSONSeq'), 'The GeoJSONSeq driver requires GDAL 2.4')
+    def test_remove_geojson_sequence(self):
+        tmpdir = tempfile.mkdtemp()
+        path = os.path.join(tmpdir, 'points.geojson')
+        sequence = os.path.join(tmpdir, 'points.geojsons')
+
+        try:
+            with open(path, 'w') as f:
+                json.dump({'type': 'FeatureCollection', 'features': [
+                    {'type': 'Feature', 'properties': {}, 'geometry': {'type': 'Point', 'coordinates': [1, 2]}}
+                ]}, f)
+
+            inspector = GDALInspector(path)
+            with mock.patch('osgeo_importer.inspectors.GEOJSON_STREAMING_SIZE', 1):
+                self.assertEqual(inspector.open().GetDriver().ShortName, 'GeoJSONSeq')
+            self.assertTrue(os.path.exists(sequence))
+
+            inspector.remove_geojson_sequence()
+            self.assertFalse(os.path.exists(sequence))
+            self.assertIsNone(inspector.data)
+        finally:
+            shutil.rmtree(tmpdir)
+
+    @skipUnless(gdal.GetDriverByName('GPKG'), 'GeoPackage rasters require GDAL 2')
+    def test_inspect_subdatasets(self):
+        tmpdir = tempfile.mkdtemp()
+        path = os.path.join(tmpdir, 'rasters.gpkg')
+        sizes = [('first', 4, 3), ('second', 8, 5), ('third', 2, 7)]
+        threads = set()
+
+        def describe_subdataset(layer_description):
+            threads.add(threading.current_thread().name)
+            return GDALInspector.describe_subdataset(layer_description)
+
+        try:
+            for i, (name, width, height) in enumerate(sizes):
+                options = ['RASTER_TABLE={}'.format(name)] + (['APPEND_SUBDATASET=YES'] if i else [])
+                dataset = gdal.GetDriverByName('GPKG').Create(path, width, height, 1, gdal.GDT_Byte, options=options)
+                dataset.SetGeoTransform([0, 1, 0, 0, 0, -1])
+                dataset.GetRasterBand(1).Fill(1)
+                dataset = None
+
+            inspector = GDALInspector(path)
+            with mock.patch('osgeo_importer.inspectors.INSPECT_SUBDATASETS', True), \
+                    mock.patch('osgeo_importer.inspectors.INSPECT_SUBDATASETS_THREADS', 2), \
+                    mock.patch.object(GDALInspector, 'describe_subdataset', side_effect=describe_subdataset):
+                description = inspector.inspect()
+            inspector.close()
+        finally:
+            shutil.rmtree(tmpdir)
+
+        # The subdatasets were opened on the pool threads and are described in the order of the file.
+        self.assertNotIn(threading.current_thread().name, threads)
+        self.assertEqual([(d['layer_name'], d['width'], d['height']) for d in description], sizes)
+        self.assertEqual([d['subdataset_index'] for d in description], [0, 1, 2])
+
+
+class TestOGRFieldConverter(SimpleTestCase):
+    def test_parse_values(self):
+        values = [u'2016-01-02', u'', u'Jan 3 2016 10:00:30+02:00']
+        self.assertEqual(list(OGRFieldConverter.parse_values(values)),
+                         [(u'2016-01-02', '2016-01-02T00:00:00'),
+                          (u'Jan 3 2016 10:00:30+02:00', '2016-01-03T10:00:30')])
+
+    def test_column_names(self):
+        columns = ['fid', 'Date', 'date_as_date']
+        self.assertEqual(find_column(columns, 'date'), 'Date')
+        self.assertRaises(KeyError, find_column, columns, 'enddate')
+        self.assertEqual(unique_column_name(columns, 'date_as_date'), 'date_as_date0')
+        self.assertEqual(unique_column_name(columns, 'date_as_date'), 'date_as_date1')
+
+
+class GetDistinctValuesTests(TestCase):
+    def test_get_distinct_values(self):
+        """ Checks that the values the converters skip (NULL, empty strings, zeros & false) are left out.
+        """
+        with connections['datastore'].cursor() as cursor:
+            cursor.execute('CREATE TEMPORARY TABLE distinct_values (number integer, string text, flag boolean);')
+            cursor.execute("INSERT INTO distinct_values VALUES (0, '', false), (0, '0', NULL), "
+                           "(20160102, '2016', true), (NULL, NULL, true);")
+
+        self.assertEqual(get_distinct_values('distinct_values', 'number'), ['20160102'])
+        self.assertEqual(sorted(get_distinct_values('distinct_values', 'string')), ['0', '2016'])
+        self.assertEqual(get_distinct_values('distinct_values', 'flag'), ['true'])
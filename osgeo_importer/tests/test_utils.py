@@ -1,14 +1,22 @@
+from datetime import datetime
 import os
 import shutil
+import tempfile
 
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.db import connections
+from django.test import SimpleTestCase, TestCase
 
 from geonode.layers.models import Layer
 from osgeo_importer.tests.helpers import works_with_geoserver
 from osgeo_importer.tests.test_settings import _TEST_FILES_DIR
-from osgeo_importer.utils import ImportHelper, import_all_layers
+from osgeo_importer.utils import (
+    DatasourcePool, ImportHelper, InspectionCache, geojson_to_geojsonseq, get_layer_encoding, import_all_layers,
+    ParseCache, parse_known_format, quote_ident, timeparse, timeparse_array
+)
+import json
 import logging
+import ogr
 
 
 logger = logging.getLogger(__name__)
@@ -72,3 +80,211 @@ class ImportUtilityTests(ImportHelper, TestCase,):
                 'Expected {} imported layers from file "{}", found {}'
                 .format(expected_layer_count, test_filename, n_imported_layers)
             )
+
+
+class QuoteIdentTests(TestCase):
+    multi_db = True
+
+    def test_quote_ident(self):
+        """ Checks quote_ident against PostgreSQL's quote_ident().
+        """
+        names = [
+            'name', 'Name', 'NAME', 'wkb_geometry', 'ogc_fid', '_private', 'a1', '1a', 'a b', 'a-b', 'a.b', 'a"b',
+            '"', '', 'date', 'date_as_date', 'end', 'user', 'table', 'order', 'select', 'between', 'time',
+            'timestamp', 'left', 'join', 'is', 'values', 'name\n', u'caf\xe9', u'\u0434\u0430\u0442\u0430',
+        ]
+
+        with connections['datastore'].cursor() as cursor:
+            for name in names:
+                cursor.execute('SELECT quote_ident(%s);', (name,))
+                self.assertEqual(quote_ident(name), cursor.fetchone()[0])
+                # Cached results are identical.
+                self.assertEqual(quote_ident(name), quote_ident(name))
+
+
+class LayerEncodingTests(SimpleTestCase):
+    def create_layer(self, values):
+        self.datasource = ogr.GetDriverByName('Memory').CreateDataSource('encoding')
+        layer = self.datasource.CreateLayer('names')
+        layer.CreateField(ogr.FieldDefn('name', ogr.OFTString))
+
+        for value in values:
+            feature = ogr.Feature(layer.GetLayerDefn())
+            feature.SetField('name', value)
+            layer.CreateFeature(feature)
+
+        return layer
+
+    def test_get_layer_encoding(self):
+        layer = self.create_layer(['caf\xc3\xa9', 'plain'])
+        self.assertIsNone(get_layer_encoding(layer))
+        self.assertEqual(get_layer_encoding(layer, encoding='cp1252'), 'cp1252')
+        self.assertIsNone(get_layer_encoding(layer, encoding='UTF-8'))
+
+        layer = self.create_layer(['plain', 'caf\xe9'])
+        self.assertEqual(get_layer_encoding(layer), 'latin1')
+        self.assertIsNone(get_layer_encoding(layer, sample_size=1))
+
+
+class DatasourcePoolTests(SimpleTestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'pool.sqlite')
+        ogr.GetDriverByName('SQLite').CreateDataSource(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_reuses_released_datasources(self):
+        pool = DatasourcePool(max_size=1, idle_timeout=60)
+        datasource = pool.acquire(self.path)
+        pool.release(self.path, datasource)
+        self.assertIs(pool.acquire(self.path), datasource)
+        self.assertIsNot(pool.acquire(self.path), datasource)
+
+    def test_drops_idle_datasources(self):
+        pool = DatasourcePool(max_size=1, idle_timeout=-1)
+        datasource = pool.acquire(self.path)
+        pool.release(self.path, datasource)
+        self.assertIsNot(pool.acquire(self.path), datasource)
+
+        pool = DatasourcePool(max_size=0, idle_timeout=60)
+        pool.release(self.path, datasource)
+        self.assertIsNot(pool.acquire(self.path), datasource)
+
+
+class InspectionCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'points.csv')
+
+        with open(self.path, 'w') as f:
+            f.write('x,y\n1,2\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_cached_descriptions(self):
+        cache = InspectionCache(max_size=1, persist=False, hash_content=True)
+        key = cache.key(self.path, {'open_options': ['X_POSSIBLE_NAMES=x']})
+        description = [{'layer_name': 'points', 'fields': []}]
+        cache.set(key, description)
+
+        cached = cache.get(key)
+        self.assertEqual(cached, description)
+        # Callers get copies they can modify.
+        cached[0]['layer_name'] = 'changed'
+        self.assertEqual(cache.get(key), description)
+
+        self.assertIsNone(cache.get(cache.key(self.path)))
+        self.assertIsNone(cache.key(self.tmpdir))
+        # Options that do not change the description are not part of the key.
+        self.assertEqual(cache.key(self.path, {'configuration_options': [{'index': 0}], 'encoding': None}),
+                         cache.key(self.path))
+
+        with open(self.path, 'a') as f:
+            f.write('3,4\n')
+
+        self.assertIsNone(cache.get(cache.key(self.path, {'open_options': ['X_POSSIBLE_NAMES=x']})))
+
+        cache.set(cache.key(self.path), description)
+        self.assertIsNone(cache.get(key))
+
+
+class InspectFilesTests(ImportHelper, SimpleTestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.paths = []
+
+        for name, content in [('a.csv', 'x,y\n1,2\n'), ('b.csv', 'x,y,z\n1,2,3\n'), ('b.prj', 'not a projection')]:
+            self.paths.append(os.path.join(self.tmpdir, name))
+
+            with open(self.paths[-1], 'w') as f:
+                f.write(content)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_inspect_files(self):
+        (a_type, a_description), (b_type, b_description), (prj_type, prj_description) = \
+            self.inspect_files(self.paths)
+
+        self.assertEqual((a_type, b_type), ('CSV', 'CSV'))
+        self.assertEqual([field['name'] for field in a_description[0]['fields']], ['x', 'y'])
+        self.assertEqual([field['name'] for field in b_description[0]['fields']], ['x', 'y', 'z'])
+        self.assertIsNone(prj_description)
+
+
+class TimeparseArrayTests(SimpleTestCase):
+    def test_timeparse_array(self):
+        timestrs = ['2016', '2016-03-04', '2016-03-04 10:20', '2016-03-04T10:20:30.5', '1200 BC', '500 AD',
+                    '-0044-03-15', 'March 4 2016', '4 Mar 2016 10:20:30', 'not a date', '']
+
+        xd, parsed = timeparse_array(timestrs)
+        self.assertEqual(zip(xd.tolist(), parsed.tolist()), [timeparse(timestr) for timestr in timestrs])
+
+    def test_timeparse_array_out_of_range(self):
+        # A value numpy rejects makes the ISO strings fall back to timeparse.
+        timestrs = ['2016-13-01', '2016-03-04']
+
+        xd, parsed = timeparse_array(timestrs)
+        self.assertEqual(zip(xd.tolist(), parsed.tolist()), [timeparse(timestr) for timestr in timestrs])
+
+
+class ParseCacheTests(SimpleTestCase):
+    def test_parse_cache(self):
+        cache = ParseCache(max_size=1)
+        self.assertIsNone(cache.get('a'))
+        cache.set('a', 1)
+        self.assertEqual(cache.get('a'), 1)
+        cache.set('b', 2)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.stats(), {'hits': 1, 'misses': 2, 'size': 1})
+
+    def test_parse_known_format(self):
+        self.assertEqual(parse_known_format('04/03/2016', ['%Y', '%d/%m/%Y']), datetime(2016, 3, 4))
+        self.assertIsNone(parse_known_format('March 4 2016', ['%d/%m/%Y']))
+
+
+class GeoJSONSequenceTests(SimpleTestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'points.geojson')
+        self.sequence = os.path.join(self.tmpdir, 'points.geojsons')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, document):
+        with open(self.path, 'w') as f:
+            json.dump(document, f, indent=2)
+
+    def test_geojson_to_geojsonseq(self):
+        features = [{'type': 'Feature', 'properties': {'id': i, 'name': 'a "b" {c}'},
+                     'geometry': {'type': 'Point', 'coordinates': [i, 1.25]}} for i in range(20)]
+        self.write({'type': 'FeatureCollection', 'features': features, 'bbox': [0, 1, 19, 1.25]})
+
+        # Chunks smaller than a feature make values span several reads.
+        for chunk_size in (1, 16, 1024 * 1024):
+            self.assertTrue(geojson_to_geojsonseq(self.path, self.sequence, chunk_size=chunk_size))
+
+            with open(self.sequence) as f:
+                self.assertEqual([json.loads(text) for text in f.read().split('\x1e') if text], features)
+
+    def test_geojson_to_geojsonseq_not_streamable(self):
+        self.write({'type': 'Feature', 'properties': {}, 'geometry': None})
+        self.assertFalse(geojson_to_geojsonseq(self.path, self.sequence))
+
+        self.write({'type': 'FeatureCollection', 'features': [],
+                    'crs': {'type': 'name', 'properties': {'name': 'urn:ogc:def:crs:EPSG::3857'}}})
+        self.assertFalse(geojson_to_geojsonseq(self.path, self.sequence))
+
+        self.write({'type': 'FeatureCollection', 'crs': {'type': 'name', 'properties': None},
+                    'features': [{'type': 'Feature', 'properties': {}, 'geometry': None}]})
+        self.assertFalse(geojson_to_geojsonseq(self.path, self.sequence))
+
+        # ESRI JSON has a features array but no GeoJSON type.
+        self.write({'geometryType': 'esriGeometryPoint', 'spatialReference': {'wkid': 4326}, 'fields': [],
+                    'features': [{'attributes': {}, 'geometry': {'x': 1, 'y': 2}}]})
+        self.assertFalse(geojson_to_geojsonseq(self.path, self.sequence))
+        self.assertEqual(os.listdir(self.tmpdir), ['points.geojson'])
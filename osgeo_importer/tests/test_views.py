@@ -1,7 +1,8 @@
-from django.test import TestCase
+from django.test import RequestFactory, TestCase
+import json
 
 from osgeo_importer import views
-from osgeo_importer.models import UploadedData
+from osgeo_importer.models import UploadedData, UploadFile, UploadLayer
 
 
 class TestFileAddView_upload(TestCase):
@@ -113,3 +114,35 @@ class TestFileAddView_upload(TestCase):
         upload = view.upload(data, view.request.user)
         self.assertEqual(upload.name, None)
         self.assertEqual(upload.file_type, None)
+
+
+class TestUploadDataImportProgressView(TestCase):
+    def setUp(self):
+        self.upload = UploadedData.objects.create(state='UPLOADED')
+        upload_file = UploadFile.objects.create(upload=self.upload, file='uploads/states.shp')
+        UploadLayer.objects.create(upload=self.upload, upload_file=upload_file, layer_name='states',
+                                   import_status='PENDING', import_stage='copy_features', feature_count=50,
+                                   features_processed=20, bytes_read=1024)
+
+    def get(self, **headers):
+        request = RequestFactory().get('/upload-data-import-progress/{}'.format(self.upload.id), **headers)
+        return views.UploadDataImportProgressView.as_view()(request, self.upload.id)
+
+    def test_progress(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content), {
+            'states.shp': {'states': {'status': 'working', 'stage': 'copy_features', 'features_total': 50,
+                                      'features_processed': 20, 'bytes_read': 1024}}
+        })
+
+    def test_etag(self):
+        etag = self.get()['ETag']
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+        UploadLayer.objects.update(features_processed=30)
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
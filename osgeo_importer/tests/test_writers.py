@@ -0,0 +1,146 @@
+from datetime import date, datetime
+from unittest import skipUnless
+
+from django.db import connections
+from django.test import SimpleTestCase, TestCase
+import gdal
+import mock
+import ogr
+
+from osgeo_importer.importers import OGRImport
+from osgeo_importer.writers import (CopyStream, CSVCopyWriter, FeatureWriterMixin, LayerRange, PostgresCopyWriter,
+                                    VectorTranslateWriter)
+
+
+class TestFeatureWriterMixin(SimpleTestCase):
+    def test_track_fid(self):
+        writer = FeatureWriterMixin(None, None)
+
+        for fid in (1, 2, 5):
+            writer.track_fid(fid)
+        self.assertTrue(writer.fids_ascending)
+
+        writer.track_fid(3)
+        writer.track_fid(4)
+        self.assertFalse(writer.fids_ascending)
+        self.assertEqual(writer.last_fid, 4)
+
+
+class TestCopyStream(SimpleTestCase):
+    def test_limit_spreads_rows_over_streams(self):
+        rows = iter(['a\n', 'b\n', 'c\n'])
+
+        first = CopyStream(rows, limit=2)
+        self.assertEqual(first.read(), 'a\nb\n')
+        self.assertEqual(first.read(), '')
+        self.assertFalse(first.exhausted)
+
+        second = CopyStream(rows, limit=2)
+        self.assertEqual(second.read(1), 'c')
+        self.assertEqual(second.read(1), '\n')
+        self.assertEqual(second.read(1), '')
+        self.assertTrue(second.exhausted)
+
+
+class TestPostgresCopyWriter(SimpleTestCase):
+    def test_escape(self):
+        self.assertEqual(PostgresCopyWriter.escape('a\tb\nc\\d\r'), 'a\\tb\\nc\\\\d\\r')
+        self.assertEqual(PostgresCopyWriter.escape(u'caf\xe9'), 'caf\xc3\xa9')
+
+    def test_ewkb_hex(self):
+        point = ogr.CreateGeometryFromWkt('POINT (1 2)')
+        self.assertEqual(
+            PostgresCopyWriter.ewkb_hex(point, 4326),
+            '0101000020e6100000000000000000f03f0000000000000040'
+        )
+        self.assertEqual(
+            PostgresCopyWriter.ewkb_hex(point, 0),
+            '0101000000000000000000f03f0000000000000040'
+        )
+
+
+class TestCSVCopyWriter(TestCase):
+    def test_cast(self):
+        """ Checks that values which do not parse as the column type are cast to NULL instead of failing.
+        """
+        writer = CSVCopyWriter(None, None)
+        column_types = ('integer', 'date', 'timestamp without time zone')
+        casts = [writer.cast('value', column_type) for column_type in column_types]
+
+        with connections['datastore'].cursor() as cursor:
+            writer.create_cast_functions(cursor)
+            cursor.execute('SELECT {0} FROM (VALUES (1, %s), (2, %s), (3, %s), (4, %s)) AS csv_values (i, value) '
+                           'ORDER BY i;'.format(', '.join(casts)), ['2016-01-02', '2016-13-45', ' ', '7'])
+            self.assertEqual(cursor.fetchall(), [
+                (None, date(2016, 1, 2), datetime(2016, 1, 2)),
+                (None, None, None),
+                (None, None, None),
+                (7, None, None),
+            ])
+
+
+class TestLayerRange(SimpleTestCase):
+    def test_iterates_over_range(self):
+        datasource = ogr.GetDriverByName('Memory').CreateDataSource('range')
+        layer = datasource.CreateLayer('points', geom_type=ogr.wkbPoint)
+
+        for i in range(10):
+            feature = ogr.Feature(layer.GetLayerDefn())
+            feature.SetGeometry(ogr.CreateGeometryFromWkt('POINT ({0} 0)'.format(i)))
+            layer.CreateFeature(feature)
+
+        self.assertEqual([f.GetFID() for f in LayerRange(layer, 3, 4)], [3, 4, 5, 6])
+        self.assertEqual([f.GetFID() for f in LayerRange(layer, 8, 4)], [8, 9])
+        self.assertEqual(LayerRange(layer, 0, 1).GetName(), 'points')
+
+
+@skipUnless(hasattr(gdal, 'VectorTranslate'), 'gdal.VectorTranslate requires GDAL 2.1')
+class TestVectorTranslateWriter(SimpleTestCase):
+    def setUp(self):
+        self.source = ogr.GetDriverByName('Memory').CreateDataSource('source')
+        # Stands in for a PostgreSQL datastore, can_write only looks at its driver name.
+        self.target = mock.Mock()
+        self.target.GetDriver.return_value.GetName.return_value = 'PostgreSQL'
+        # can_write only looks at the geometry type of the target layer, it does not need to exist in the datastore.
+        self.target_layers = ogr.GetDriverByName('Memory').CreateDataSource('target')
+        self.writer = VectorTranslateWriter(OGRImport('source'), self.source)
+
+    def create_layer(self, datasource, name, geom_type, fields=()):
+        layer = datasource.CreateLayer(name, geom_type=geom_type)
+
+        for field_name, field_type in fields:
+            layer.CreateField(ogr.FieldDefn(field_name, field_type))
+
+        return layer
+
+    def test_can_write(self):
+        layer = self.create_layer(self.source, 'points', ogr.wkbPoint, [('name', ogr.OFTString)])
+        target_layer = self.create_layer(self.target_layers, 'points', ogr.wkbPoint)
+        self.assertTrue(self.writer.can_write(layer, self.target, target_layer))
+
+    def test_can_write_generic_target(self):
+        # Mixed single & Multi* layers are loaded into a generic geometry column promoted after the load.
+        layer = self.create_layer(self.source, 'polygons', ogr.wkbPolygon)
+        target_layer = self.create_layer(self.target_layers, 'polygons', ogr.wkbUnknown)
+        self.assertTrue(self.writer.can_write(layer, self.target, target_layer))
+
+    def test_can_write_falls_back(self):
+        layer = self.create_layer(self.source, 'points', ogr.wkbPoint, [('name', ogr.OFTString)])
+        target_layer = self.create_layer(self.target_layers, 'points', ogr.wkbPoint)
+
+        # Only PostgreSQL targets.
+        self.assertFalse(self.writer.can_write(layer, self.target_layers, target_layer))
+        # FIDs remapped from a source field.
+        self.assertFalse(self.writer.can_write(layer, self.target, target_layer, source_fid=0))
+        # Geometries converted to another type.
+        multi_layer = self.create_layer(self.target_layers, 'multipoints', ogr.wkbMultiPoint)
+        self.assertFalse(self.writer.can_write(layer, self.target, multi_layer))
+        # Source wkb_geometry fields the importer does not create.
+        wkb_layer = self.create_layer(self.source, 'wkb', ogr.wkbPoint, [('wkb_geometry', ogr.OFTString)])
+        self.assertFalse(self.writer.can_write(wkb_layer, self.target, target_layer))
+
+        # Strings decoded from another encoding, layers without string fields need no decoding.
+        self.writer.encoding = 'latin1'
+        self.assertFalse(self.writer.can_write(layer, self.target, target_layer))
+        numbers_layer = self.create_layer(self.source, 'numbers', ogr.wkbPoint, [('value', ogr.OFTInteger)])
+        self.assertTrue(self.writer.can_write(numbers_layer, self.target, target_layer))
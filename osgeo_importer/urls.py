@@ -3,7 +3,9 @@ from django.conf.urls import patterns, url, include
 from django.contrib.auth.decorators import login_required
 from tastypie.api import Api
 
-from osgeo_importer.views import OneShotImportDemoView, OneShotFileUploadView, UploadDataImportStatusView, BulkImport
+from osgeo_importer.views import (
+    OneShotImportDemoView, OneShotFileUploadView, UploadDataImportStatusView, UploadDataImportProgressView, BulkImport
+)
 
 from .api import UploadedDataResource, UploadedLayerResource, UploadedFileResource  # noqa
 from .views import FileAddView, UploadListView
@@ -25,5 +27,6 @@ urlpatterns = patterns("",
                        url(r'^bulk-import/?$', login_required(BulkImport.as_view())),
                        url(r'^one-shot-demo/?$', login_required(OneShotImportDemoView.as_view())),
                        url(r'^upload-data-import-status/(\d+)/?$', UploadDataImportStatusView.as_view()),
+                       url(r'^upload-data-import-progress/(\d+)/?$', UploadDataImportProgressView.as_view()),
                        url(r'^one-shot-demo_file-upload/?$', OneShotFileUploadView.as_view()),
                        url(r'', include(importer_api.urls)),)
@@ -1,15 +1,24 @@
+import codecs
 from cStringIO import StringIO
 import collections
+import copy
 from datetime import datetime
 import errno
+import hashlib
+import itertools
+import json
 import logging
 import os
 import re
 import shutil
 import sys
+import threading
+import time
 from urlparse import urlparse
 import uuid
 
+from multiprocessing.pool import ThreadPool
+
 from dateutil.parser import parse
 from django import db
 from django.conf import settings
@@ -23,6 +32,11 @@ import osr
 
 logger = logging.getLogger(__name__)
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 try:
     from django.utils.module_loading import import_string
 except ImportError:
@@ -52,24 +66,50 @@ GDAL_GEOMETRY_TYPES = {
    7 + -2147483648: 'GeometryCollection',
    }
 
+# Number of threads inspecting the files of an upload concurrently.
+INSPECTION_THREADS = getattr(settings, 'OSGEO_IMPORTER_INSPECTION_THREADS', 4)
+# Parts of a shapefile that are inspected through their .shp file.
+SHAPEFILE_PART_EXTENSIONS = ['.prj', '.dbf', '.shx']
 
-def timeparse(timestr):
-    import numpy
-    DEFAULT = datetime(1, 1, 1)
+# strptime formats of the dates in uploads, dates in these formats skip the heuristic parsing.
+IMPORT_DATE_FORMATS = getattr(settings, 'IMPORT_DATE_FORMATS', [])
+
+BCE_PATTERN = re.compile(r'bce?', flags=re.I)
+AD_PATTERN = re.compile(r'ad', flags=re.I)
+# Normalized time strings numpy.datetime64 parses, they are converted in bulk by timeparse_array.
+ISO_TIME_PATTERN = re.compile(r'-?\d{4}(-\d{2}(-\d{2}([T ]\d{2}:\d{2}(:\d{2}(\.\d{1,3})?)?)?)?)?$')
+
+
+def normalize_timestr(timestr):
+    """
+    Applies the BCE/AD rules of timeparse, returns the time string with a leading '-' for BCE dates and whether
+    the date is BCE.
+    """
     bc = False
-    if re.search(r'bce?', timestr, flags=re.I):
+    if BCE_PATTERN.search(timestr):
         bc = True
-        timestr = re.sub(r'bce?', '', timestr, flags=re.I)
-    if re.match('-', timestr, flags=re.I):
+        timestr = BCE_PATTERN.sub('', timestr)
+    if timestr.startswith('-'):
         bc = True
         timestr = timestr.replace('-', '', 1)
-    if re.search(r'ad', timestr, flags=re.I):
-        timestr = re.sub('ad', '', timestr, flags=re.I)
+    if AD_PATTERN.search(timestr):
+        timestr = AD_PATTERN.sub('', timestr)
 
     if bc is True:
         timestr = "-%s" % timestr
 
-    timestr = timestr.strip()
+    return timestr.strip(), bc
+
+
+def timeparse(timestr):
+    return timeparse_normalized(*normalize_timestr(timestr))
+
+
+def timeparse_normalized(timestr, bc):
+    if numpy is None:
+        raise ImportError('numpy is required to parse dates with timeparse.')
+
+    DEFAULT = datetime(1, 1, 1)
 
     try:
         t = numpy.datetime64(timestr).astype('datetime64[ms]').astype('int64')
@@ -91,6 +131,146 @@ def timeparse(timestr):
     return None, None
 
 
+class ParseCache(object):
+    """
+    A bounded LRU cache of parsed date strings shared by the field converters.  The hits and misses counters
+    help to size it with OSGEO_IMPORTER_DATE_PARSE_CACHE_SIZE.
+    """
+
+    def __init__(self, max_size=None):
+        if max_size is None:
+            max_size = getattr(settings, 'OSGEO_IMPORTER_DATE_PARSE_CACHE_SIZE', 100000)
+
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.pop(key, None)
+
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.entries[key] = value
+
+        return value
+
+    def set(self, key, value):
+        if not self.max_size:
+            return
+
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = value
+
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self.entries)}
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = self.misses = 0
+
+
+date_parse_cache = ParseCache()
+
+
+def parse_known_format(timestr, formats=None):
+    """
+    Returns the datetime of a string in one of the IMPORT_DATE_FORMATS, None if it is in none of them.
+    """
+    for date_format in IMPORT_DATE_FORMATS if formats is None else formats:
+        try:
+            return datetime.strptime(timestr.strip(), date_format)
+        except ValueError:
+            continue
+
+
+def parse_date(timestr):
+    """
+    Parses a date string with the IMPORT_DATE_FORMATS or else dateutil, using the shared parse cache.
+    """
+    key = ('parse', timestr)
+    dt = date_parse_cache.get(key)
+
+    if dt is None:
+        dt = parse_known_format(timestr) or parse(timestr)
+        date_parse_cache.set(key, dt)
+
+    return dt
+
+
+def timeparse_list(timestrs):
+    """
+    Returns timeparse's (milliseconds, parsed date) pair of each string.  Strings in ISO 8601 form are converted
+    with one numpy.datetime64 array operation, strings in one of the IMPORT_DATE_FORMATS with strptime, only the
+    others are parsed one at a time.
+    """
+    normalized = [normalize_timestr(timestr) for timestr in timestrs]
+    results = [None] * len(normalized)
+
+    iso = [i for i, (timestr, _) in enumerate(normalized) if ISO_TIME_PATTERN.match(timestr)]
+    leftovers = [i for i, (timestr, _) in enumerate(normalized) if not ISO_TIME_PATTERN.match(timestr)]
+
+    if iso:
+        try:
+            values = numpy.array([normalized[i][0] for i in iso], dtype='datetime64[ms]')
+        except ValueError:
+            # Out of range parts, e.g. a 13th month, fail the whole array.
+            leftovers.extend(iso)
+        else:
+            xd = values.astype('int64').tolist()
+            parsed = numpy.datetime_as_string(values, unit='ms').tolist()
+
+            for i, t, parsed_timestr in zip(iso, xd, parsed):
+                results[i] = (t, parsed_timestr)
+
+    for i in leftovers:
+        timestr, bc = normalized[i]
+        dt = None if bc else parse_known_format(timestrs[i])
+
+        if dt is not None:
+            t = numpy.datetime64(dt.isoformat()).astype('datetime64[ms]').astype('int64')
+            results[i] = (int(t), str(numpy.datetime64(t, 'ms')))
+        else:
+            t, parsed_timestr = timeparse_normalized(timestr, bc)
+            results[i] = (None if t is None else int(t), parsed_timestr)
+
+    return results
+
+
+def timeparse_array(timestrs):
+    """
+    Parses a sequence of time strings like timeparse, see timeparse_list, using the shared parse cache.
+    Returns the milliseconds since the epoch as a masked int64 array, masked where a string could not be
+    parsed, and the parsed dates as an object array holding None for those strings.
+    """
+    if numpy is None:
+        raise ImportError('numpy is required to parse dates with timeparse_array.')
+
+    timestrs = list(timestrs)
+    results = [date_parse_cache.get(('timeparse', timestr)) for timestr in timestrs]
+    missing = [i for i, result in enumerate(results) if result is None]
+
+    for i, result in zip(missing, timeparse_list([timestrs[i] for i in missing])):
+        results[i] = result
+        date_parse_cache.set(('timeparse', timestrs[i]), result)
+
+    xd = numpy.array([t or 0 for t, _ in results], dtype='int64')
+    mask = numpy.array([t is None for t, _ in results], dtype=bool)
+    parsed = numpy.empty(len(results), dtype=object)
+    parsed[:] = [parsed_timestr for _, parsed_timestr in results]
+
+    return numpy.ma.masked_array(xd, mask=mask), parsed
+
+
 def ensure_defaults(layer):
     """
     Sets a geoserver feature type defaults.
@@ -285,12 +465,230 @@ def raster_import(infile, outfile, *args, **kwargs):
 
     return outfile
 
-def quote_ident(str):
-    conn = db.connections[settings.OSGEO_DATASTORE]
-    cursor = conn.cursor()
-    query = "SELECT quote_ident(%s);"
-    cursor.execute(query, (str,))
-    return cursor.fetchone()[0]
+
+class StreamingJSONReader(object):
+    """
+    Reads the values of a large JSON document one at a time, only the value being decoded and one chunk of the
+    file are held in memory.
+    """
+    whitespace = ' \t\n\r'
+
+    def __init__(self, stream, chunk_size=1024 * 1024):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.position = 0
+
+    def fill(self):
+        """
+        Drops the consumed part of the buffer and appends the next chunk, returns False at the end of the file.
+        """
+        chunk = self.stream.read(self.chunk_size)
+
+        if not chunk:
+            return False
+
+        self.buffer = self.buffer[self.position:] + chunk
+        self.position = 0
+        return True
+
+    def peek(self):
+        """
+        Skips whitespace and returns the next character, None at the end of the file.
+        """
+        while True:
+            while self.position < len(self.buffer) and self.buffer[self.position] in self.whitespace:
+                self.position += 1
+
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+
+            if not self.fill():
+                return None
+
+    def expect(self, chars):
+        """
+        Consumes the next character, which has to be one of `chars`.
+        """
+        char = self.peek()
+
+        if char is None or char not in chars:
+            raise ValueError('Expected one of {0!r}, found {1!r}'.format(chars, char))
+
+        self.position += 1
+        return char
+
+    def value(self):
+        """
+        Decodes the next value.
+
+        :return: The value and its JSON text.
+        """
+        self.peek()
+
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+            except ValueError:
+                # The value continues in the next chunk.
+                if not self.fill():
+                    raise
+                continue
+
+            # So might a number ending with the buffer.
+            if end == len(self.buffer) and self.fill():
+                continue
+
+            text = self.buffer[self.position:end]
+            self.position = end
+            return value, text
+
+
+def geojson_to_geojsonseq(path, out_path, chunk_size=1024 * 1024):
+    """
+    Rewrites a GeoJSON FeatureCollection as a GeoJSON text sequence (RFC 8142) one feature at a time, which OGR's
+    GeoJSONSeq driver reads without loading the whole document into memory.
+
+    :return: False if the document cannot be read as a sequence, e.g. it is not a FeatureCollection or its crs
+             is not WGS84.
+    """
+    wgs84 = ['urn:ogc:def:crs:OGC:1.3:CRS84', 'urn:ogc:def:crs:EPSG::4326', 'EPSG:4326']
+    tmp_path = '{0}.{1}.tmp'.format(out_path, os.getpid())
+    # ESRI JSON also has a features array, only documents typed as FeatureCollection are GeoJSON.
+    feature_collection = has_features = False
+
+    try:
+        with open(path, 'rb') as stream, open(tmp_path, 'wb') as out:
+            reader = StreamingJSONReader(stream, chunk_size)
+            reader.expect('{')
+
+            while reader.peek() != '}':
+                key, _ = reader.value()
+                reader.expect(':')
+
+                if key == 'features':
+                    has_features = True
+                    reader.expect('[')
+
+                    while reader.peek() != ']':
+                        _, text = reader.value()
+                        out.write('\x1e' + text + '\n')
+
+                        if reader.expect(',]') == ']':
+                            break
+                    else:
+                        reader.expect(']')
+                else:
+                    value, _ = reader.value()
+
+                    if key == 'type':
+                        if value != 'FeatureCollection':
+                            return False
+                        feature_collection = True
+
+                    if key == 'crs' and ((value or {}).get('properties') or {}).get('name') not in wgs84:
+                        return False
+
+                if reader.expect(',}') == '}':
+                    break
+
+        if not (feature_collection and has_features):
+            return False
+
+        os.rename(tmp_path, out_path)
+        return True
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+# PostgreSQL keywords that are not unreserved (reserved, type/function name and column name keywords) in some
+# version, an identifier spelled like one of them is quoted.  Quoting it on versions where it is unreserved is
+# harmless.
+POSTGRESQL_KEYWORDS = frozenset("""
+    all analyse analyze and any array as asc asymmetric authorization between bigint binary bit boolean both
+    case cast char character check coalesce collate collation column concurrently constraint create cross
+    current_catalog current_date current_role current_schema current_time current_timestamp current_user dec
+    decimal default deferrable desc distinct do else end except exists extract false fetch float for foreign
+    freeze from full grant greatest group grouping having ilike in initially inner inout int integer intersect
+    interval into is isnull join json json_array json_arrayagg json_exists json_object json_objectagg json_query
+    json_scalar json_serialize json_table json_value lateral leading least left like limit localtime
+    localtimestamp merge_action national natural nchar none normalize not notnull null nullif numeric offset on
+    only or order out outer over overlaps overlay placing position precision primary real references returning right
+    row select session_user setof similar smallint some substring symmetric system_user table tablesample then
+    time timestamp to trailing treat trim true union unique user using values varchar variadic verbose when where
+    window with xmlattributes xmlconcat xmlelement xmlexists xmlforest xmlnamespaces xmlparse xmlpi xmlroot
+    xmlserialize xmltable
+""".split())
+SAFE_IDENTIFIER = re.compile(r'[a-z_][a-z0-9_]*\Z')
+quoted_identifiers = {}
+
+
+def quote_ident(identifier):
+    """
+    Quotes an identifier following the rules of PostgreSQL's quote_ident(), without a query: identifiers of
+    lower case letters, digits and underscores not starting with a digit are left as is unless they are keywords,
+    others are put in double quotes with their double quotes doubled.
+    """
+    quoted = quoted_identifiers.get(identifier)
+
+    if quoted is None:
+        if SAFE_IDENTIFIER.match(identifier) and identifier not in POSTGRESQL_KEYWORDS:
+            quoted = identifier
+        else:
+            quoted = '"' + identifier.replace('"', '""') + '"'
+
+        if len(quoted_identifiers) >= 10000:
+            quoted_identifiers.clear()
+
+        quoted_identifiers[identifier] = quoted
+
+    return quoted
+
+
+def get_layer_encoding(layer, encoding=None, sample_size=None, encodings=('utf8', 'latin1')):
+    """
+    Resolves the encoding of the string fields of an OGR layer once, from an explicit `encoding` or by decoding
+    a sample of its features with each of `encodings` in turn.  Layers whose driver already recodes strings
+    to UTF-8 (e.g. shapefiles with a .cpg file or an ENCODING open option) need no decoding.
+
+    :return: The encoding to decode the strings of the layer with, None if they are UTF-8 already.
+    """
+    if layer.TestCapability(ogr.OLCStringsAsUTF8):
+        return None
+
+    definition = layer.GetLayerDefn()
+    fields = [i for i in range(definition.GetFieldCount()) if definition.GetFieldDefn(i).GetType() == ogr.OFTString]
+
+    if not fields:
+        return None
+
+    if encoding:
+        return None if codecs.lookup(encoding).name == 'utf-8' else encoding
+
+    if sample_size is None:
+        sample_size = getattr(settings, 'OSGEO_IMPORTER_ENCODING_SAMPLE_SIZE', 1000)
+
+    values = []
+    layer.ResetReading()
+
+    try:
+        for feature in itertools.islice(layer, sample_size):
+            values.extend(feature.GetField(i) for i in fields if feature.IsFieldSet(i))
+    finally:
+        layer.ResetReading()
+
+    for candidate in encodings:
+        try:
+            for value in values:
+                value.decode(candidate)
+        except UnicodeDecodeError:
+            continue
+
+        return None if codecs.lookup(candidate).name == 'utf-8' else candidate
+
+    return encodings[-1]
 
 
 def decode(s, encodings=('ascii', 'utf8', 'latin1')):
@@ -329,6 +727,47 @@ class ImportHelper(object):
         with self.Inspector(path) as opened_file:
             return opened_file.file_type()
 
+    def inspect_file(self, path):
+        """
+        Returns the file type and the layer descriptions of a file, opening it once.  The descriptions are None
+        for the parts of a shapefile.  A NoDataSourceFound error is returned in place of the descriptions, so
+        it can be raised where configure_upload handles the file.
+        """
+        file_type = description = None
+
+        try:
+            with self.Inspector(path) as opened_file:
+                file_type = opened_file.file_type()
+
+                if os.path.splitext(path)[1].lower() not in SHAPEFILE_PART_EXTENSIONS:
+                    description = opened_file.describe_fields()
+        except NoDataSourceFound as e:
+            if os.path.splitext(path)[1].lower() not in SHAPEFILE_PART_EXTENSIONS:
+                description = e
+
+        return file_type, description
+
+    def inspect_file_in_thread(self, path):
+        try:
+            return self.inspect_file(path)
+        finally:
+            # Close the database connections the inspection opened for this pool thread.
+            db.connections.close_all()
+
+    def inspect_files(self, paths):
+        """
+        Inspects independent files on a bounded thread pool, returns (file type, descriptions) in path order.
+        """
+        if len(paths) < 2 or INSPECTION_THREADS < 2:
+            return [self.inspect_file(path) for path in paths]
+
+        pool = ThreadPool(min(INSPECTION_THREADS, len(paths)))
+        try:
+            return pool.map(self.inspect_file_in_thread, paths)
+        finally:
+            pool.close()
+            pool.join()
+
     def upload(self, data, owner, upload_size=0):
         """Use cleaned form data to populate an unsaved upload record.
 
@@ -487,23 +926,21 @@ class ImportHelper(object):
         # Loop through and create uploadfiles and uploadlayers
         upfiles = []
         styles = [os.path.basename(x) for x in finalfiles if '.sld' in x.lower()]
-        for each in finalfiles:
+        inspections = self.inspect_files(finalfiles)
+        for each, (file_type, description) in zip(finalfiles, inspections):
             upfile = UploadFile.objects.create(upload=upload)
             upfiles.append(upfile)
             upfile.file.name = each
             # Detect and store file type for later reporting, since it is no
             # longer true that every upload has only one file type.
-            try:
-                upfile.file_type = self.get_file_type(each)
-            except NoDataSourceFound:
-                upfile.file_type = None
+            upfile.file_type = file_type
             upfile.save()
-            upfile_basename = os.path.basename(each)
-            _, upfile_ext = os.path.splitext(upfile_basename)
+
+            if isinstance(description, NoDataSourceFound):
+                raise description
 
             # If this file isn't part of a shapefile
-            if upfile_ext.lower() not in ['.prj', '.dbf', '.shx']:
-                description = self.get_fields(each)
+            if description is not None:
                 for layer_desc in description:
                     configuration_options = DEFAULT_LAYER_CONFIGURATION.copy()
                     configuration_options.update({'index': layer_desc.get('index')})
@@ -643,102 +1080,6 @@ def convert_wkt_to_epsg(wkt, epsg_directory=settings.PROJECTION_DIRECTORY, force
         raise Exception(msg)
 
 
-def reproject_coordinate_system(original_layer_name, layer_name, in_shp_layer, layer_path):
-
-    def get_geometry_type(geometry_name):
-        switcher = {
-            "POINT": ogr.wkbPoint,
-            "MULTIPOINT": ogr.wkbMultiPoint,
-            "LINESTRING": ogr.wkbLineString,
-            "MULTILINESTRING": ogr.wkbMultiLineString,
-            "POLYGON": ogr.wkbPolygon,
-            "MULTIPOLYGON": ogr.wkbMultiPolygon
-        }
-        return switcher.get(geometry_name)
-
-    shp_driver = ogr.GetDriverByName('ESRI Shapefile')
-
-    # input SpatialReference
-    input_srs = in_shp_layer.GetSpatialRef()
-
-    # output SpatialReference
-    output_srs = osr.SpatialReference()
-    output_srs.ImportFromEPSG(4326)
-
-    # create the CoordinateTransformation
-    coord_trans = osr.CoordinateTransformation(input_srs, output_srs)
-
-    # create the output layer
-    output_shp_file = '{}/{}_reproj.shp'.format(layer_path, layer_name)
-
-    # check if output file exists if yes delete it
-    if os.path.exists(output_shp_file):
-        shp_driver.DeleteDataSource(output_shp_file)
-
-    # create a new Shapefile object
-    output_shp_dataset = shp_driver.CreateDataSource(output_shp_file)
-
-    # create a new layer in output Shapefile and define its geometry type
-    feature = in_shp_layer.GetNextFeature()
-    geometry = feature.GetGeometryRef()
-    geometry_type = get_geometry_type(geometry.GetGeometryName())
-    output_shp_layer = output_shp_dataset.CreateLayer('{}_4326'.format(layer_name), output_srs, geometry_type)
-    in_shp_layer.ResetReading()
-
-    # add fields to the new output Shapefile
-    # get list of attribute fields
-    # create new fields for output
-    in_layer_def = in_shp_layer.GetLayerDefn()
-    for i in range(0, in_layer_def.GetFieldCount()):
-        field_def = in_layer_def.GetFieldDefn(i)
-        output_shp_layer.CreateField(field_def)
-
-    # get the output layer's feature definition
-    output_layer_def = output_shp_layer.GetLayerDefn()
-
-    # loop through the input features
-    in_feature = in_shp_layer.GetNextFeature()
-    while in_feature:
-        # get the input geometry
-        geom = in_feature.GetGeometryRef()
-        # reproject the geometry
-        geom.Transform(coord_trans)
-        # create a new feature
-        output_feature = ogr.Feature(output_layer_def)
-        # set the geometry and attribute
-        output_feature.SetGeometry(geom)
-        for i in range(0, output_layer_def.GetFieldCount()):
-            output_feature.SetField(output_layer_def.GetFieldDefn(i).GetNameRef(), in_feature.GetField(i))
-        # add the feature to the shapefile
-        output_shp_layer.CreateFeature(output_feature)
-        # destroy the features and get the next input feature
-        output_feature.Destroy()
-        in_feature.Destroy()
-        in_feature = in_shp_layer.GetNextFeature()
-
-    # close the shapefiles
-    output_shp_dataset.Destroy()
-
-    spatialRef = osr.SpatialReference()
-    spatialRef.ImportFromEPSG(4326)
-
-    spatialRef.MorphToESRI()
-    prj_file = open('{}/{}_reproj.prj'.format(layer_path, layer_name), 'w')
-    prj_file.write(spatialRef.ExportToWkt())
-    prj_file.close()
-
-    for file_name in os.listdir(layer_path):
-        if os.path.splitext(file_name)[0] == original_layer_name:
-            os.remove(os.path.join(layer_path, file_name))
-
-    for file_name in os.listdir(layer_path):
-        if os.path.splitext(file_name)[0] == '{}_reproj'.format(layer_name):
-            extension = os.path.splitext(file_name)[1][1:].strip().lower()
-            os.rename(os.path.join(layer_path, file_name), os.path.join(layer_path, '{}.{}'.format(original_layer_name, extension)))
-
-    return '{0}:{1}'.format(output_srs.GetAuthorityName(None), output_srs.GetAuthorityCode(None))
-
-
 def database_schema_name():
     db_settings = db.connections[settings.OSGEO_DATASTORE].settings_dict
     schema = 'public'
@@ -748,3 +1089,299 @@ def database_schema_name():
         schema = map(str.strip, search_path.split(','))[0]
 
     return schema
+
+
+def datastore_connection_string():
+    """
+    Returns the OGR connection string of the datastore database.
+    """
+    d = db.connections[settings.OSGEO_DATASTORE].settings_dict
+    return "PG:dbname='%s' user='%s' password='%s' host='%s' port='%s' schemas=%s" % (
+        d['NAME'], d['USER'], d['PASSWORD'], d['HOST'], d['PORT'], database_schema_name())
+
+
+NUMERIC_TYPES = ('smallint', 'integer', 'bigint', 'numeric', 'real', 'double precision')
+
+
+def get_attribute_statistics(table, fields, unique_values_limit=None):
+    """
+    Returns the statistics GeoNode keeps for the attributes of a layer, computed with one aggregate query over
+    the datastore table instead of a WPS request per attribute.  `fields` is a list of column names or a dict
+    mapping the attribute names to the columns of the table, the statistics are keyed by attribute name:
+    {<field>: {'Count': ..., 'Min': ..., 'Max': ..., 'Average': ..., 'Median': ..., 'StandardDeviation': ...,
+    'Sum': ..., 'NullCount': ..., 'unique_values': ...}}, the numeric statistics are None for non numeric fields.
+    unique_values lists at most `unique_values_limit` distinct values as JSON, fields with more distinct values
+    get 'NA'.
+    """
+    if unique_values_limit is None:
+        unique_values_limit = getattr(settings, 'OSGEO_IMPORTER_UNIQUE_VALUES_LIMIT', 100)
+
+    if not isinstance(fields, dict):
+        fields = dict((field, field) for field in fields)
+
+    schema = quote_ident(database_schema_name())
+    qualified_table = '{0}.{1}'.format(schema, quote_ident(table))
+
+    with db.connections[settings.OSGEO_DATASTORE].cursor() as cursor:
+        cursor.execute('SELECT column_name, data_type FROM information_schema.columns '
+                       'WHERE table_schema = %s AND table_name = %s AND data_type NOT IN (%s, %s)',
+                       [database_schema_name(), table, 'USER-DEFINED', 'bytea'])
+        data_types = dict(cursor.fetchall())
+        columns = [(field, column, data_types[column] in NUMERIC_TYPES)
+                   for field, column in sorted(fields.items()) if column in data_types]
+
+        if not columns:
+            return {}
+
+        aggregates = []
+        for _, name, numeric in columns:
+            if numeric:
+                numeric_aggregates = ['min({0})', 'max({0})', 'avg({0})', 'stddev_samp({0})', 'sum({0})',
+                                      'percentile_cont(0.5) WITHIN GROUP (ORDER BY {0})']
+            else:
+                numeric_aggregates = ['NULL'] * 6
+
+            # Read one distinct value more than the limit, which tells whether the column has too many distinct
+            # values to list without counting all of them.
+            unique_values = ('(SELECT array_agg(value ORDER BY value) FROM (SELECT DISTINCT {{0}}::text AS value '
+                             'FROM {0} WHERE {{0}} IS NOT NULL LIMIT {1:d}) AS unique_values)'
+                             .format(qualified_table, unique_values_limit + 1))
+            column_aggregates = ['count({0})', 'count(*) - count({0})'] + numeric_aggregates + [unique_values]
+            column = quote_ident(name)
+            aggregates.extend(aggregate.format(column) for aggregate in column_aggregates)
+
+        cursor.execute('SELECT {0} FROM {1}'.format(', '.join(aggregates), qualified_table))
+        row = cursor.fetchone()
+
+    statistics = {}
+    for i, (field, _, _) in enumerate(columns):
+        count, null_count, minimum, maximum, average, stddev, total, median, unique_values = row[i * 9:i * 9 + 9]
+        unique_values = unique_values or []
+        statistics[field] = {
+            'Count': count,
+            'NullCount': null_count,
+            'Min': minimum,
+            'Max': maximum,
+            'Average': average,
+            'Median': median,
+            'StandardDeviation': stddev,
+            'Sum': total,
+            'unique_values': json.dumps(unique_values) if len(unique_values) <= unique_values_limit else 'NA',
+        }
+
+    return statistics
+
+
+class DatasourcePool(object):
+    """
+    A per-process pool of writable OGR datasources keyed by connection string.
+
+    Reusing a datasource saves the connection setup and the schema introspection OGR runs when a PostgreSQL
+    datasource is opened.  Idle datasources are health-checked before they are handed out again and dropped
+    after `idle_timeout` seconds, at most `max_size` idle datasources are kept.  A `max_size` of 0 disables
+    pooling.
+    """
+
+    def __init__(self, max_size=None, idle_timeout=None):
+        if max_size is None:
+            max_size = getattr(settings, 'OSGEO_IMPORTER_DATASOURCE_POOL_SIZE', 4)
+
+        if idle_timeout is None:
+            idle_timeout = getattr(settings, 'OSGEO_IMPORTER_DATASOURCE_POOL_IDLE_TIMEOUT', 300)
+
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+        # Connection string -> list of (datasource, release time), most recently released last.
+        self.idle = collections.defaultdict(list)
+        self.inherited = []
+
+    def check_process(self):
+        """
+        Forgets the datasources of the parent process after a fork.  They are kept referenced, as closing them
+        would terminate the connections the parent is still using.
+        """
+        if os.getpid() != self.pid:
+            self.inherited.extend(self.idle.values())
+            self.idle = collections.defaultdict(list)
+            self.pid = os.getpid()
+
+    @staticmethod
+    def is_healthy(datasource):
+        try:
+            datasource.ReleaseResultSet(datasource.ExecuteSQL('SELECT 1'))
+            return True
+        except RuntimeError:
+            return False
+
+    def prune(self, now):
+        for entries in self.idle.values():
+            entries[:] = [(datasource, released) for datasource, released in entries
+                          if now - released <= self.idle_timeout]
+
+    def acquire(self, connection_string):
+        """
+        Returns an idle, healthy datasource for `connection_string` or opens a new one.
+        """
+        with self.lock:
+            self.check_process()
+            self.prune(time.time())
+            entries = self.idle[connection_string]
+
+            while entries:
+                datasource, _ = entries.pop()
+
+                if self.is_healthy(datasource):
+                    return datasource
+
+        return ogr.Open(connection_string, 1)
+
+    def release(self, connection_string, datasource):
+        """
+        Returns a datasource to the pool, the datasource is closed if the pool is full.
+        """
+        if datasource is None:
+            return
+
+        with self.lock:
+            self.check_process()
+            now = time.time()
+            self.prune(now)
+
+            if sum(len(entries) for entries in self.idle.values()) < self.max_size:
+                self.idle[connection_string].append((datasource, now))
+
+    def clear(self, connection_string=None):
+        """
+        Closes the idle datasources of `connection_string` or of every connection string, e.g. after tables were
+        renamed or dropped behind the back of the cached layer lists.
+        """
+        with self.lock:
+            self.check_process()
+
+            if connection_string is None:
+                self.idle.clear()
+            else:
+                self.idle.pop(connection_string, None)
+
+
+datasource_pool = DatasourcePool()
+
+
+class InspectionCache(object):
+    """
+    A per-process LRU cache of inspector descriptions keyed by the path, size and modification time of a file,
+    the opening options that change its description and optionally an md5 digest of its contents.
+
+    Descriptions are also stored in the InspectionResult table when `persist` is set, so the web and worker
+    processes of an upload share them.  A `max_size` of 0 disables caching.
+    """
+
+    # Keyword arguments of GDALInspector.open that change the description of a file.  The importer opens files
+    # with its whole layer configuration, which must not keep it from hitting the entries of configure_upload.
+    description_options = ('open_options', 'encoding')
+
+    def __init__(self, max_size=None, persist=None, hash_content=None):
+        if max_size is None:
+            max_size = getattr(settings, 'OSGEO_IMPORTER_INSPECTION_CACHE_SIZE', 64)
+
+        if persist is None:
+            persist = getattr(settings, 'OSGEO_IMPORTER_INSPECTION_CACHE_PERSIST', False)
+
+        if hash_content is None:
+            hash_content = getattr(settings, 'OSGEO_IMPORTER_INSPECTION_CACHE_HASH', False)
+
+        self.max_size = max_size
+        self.persist = persist
+        self.hash_content = hash_content
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict()
+
+    @staticmethod
+    def file_digest(path, chunk_size=1024 * 1024):
+        digest = hashlib.md5()
+
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                digest.update(chunk)
+
+        return digest.hexdigest()
+
+    def key(self, path, options=None):
+        """
+        Returns the cache key of `path`, or None when it is not a regular file (e.g. a connection string).
+        """
+        if not self.max_size or not os.path.isfile(path):
+            return
+
+        stat = os.stat(path)
+        content_hash = self.file_digest(path) if self.hash_content else ''
+        options = dict((name, value) for name, value in (options or {}).items()
+                       if name in self.description_options and value)
+        return (os.path.abspath(path), stat.st_size, stat.st_mtime, json.dumps(options, sort_keys=True, default=str),
+                content_hash)
+
+    def get(self, key):
+        if key is None:
+            return
+
+        with self.lock:
+            description = self.entries.pop(key, None)
+
+            if description is not None:
+                self.entries[key] = description
+
+        if description is None and self.persist:
+            description = self.load(key)
+
+            if description is not None:
+                self.store(key, description)
+
+        return copy.deepcopy(description)
+
+    def set(self, key, description):
+        if key is None:
+            return
+
+        self.store(key, copy.deepcopy(description))
+
+        if self.persist:
+            self.save(key, description)
+
+    def store(self, key, description):
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = description
+
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    @staticmethod
+    def lookup(key):
+        path, size, mtime, options, content_hash = key
+        return dict(path=path, size=size, mtime=mtime, options=options, content_hash=content_hash)
+
+    def load(self, key):
+        from osgeo_importer.models import InspectionResult
+
+        try:
+            return InspectionResult.objects.filter(**self.lookup(key)).values_list('description', flat=True)[0]
+        except IndexError:
+            return
+
+    def save(self, key, description):
+        from osgeo_importer.models import InspectionResult
+
+        lookup = self.lookup(key)
+        InspectionResult.objects.update_or_create(defaults={'description': description}, **lookup)
+        # The entries of earlier versions of the file can no longer be hit.
+        InspectionResult.objects.filter(path=lookup['path']).exclude(
+            size=lookup['size'], mtime=lookup['mtime'], content_hash=lookup['content_hash']).delete()
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+inspection_cache = InspectionCache()
@@ -1,3 +1,4 @@
+import hashlib
 import json
 import logging
 import os
@@ -9,7 +10,7 @@ import zipfile
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.core.urlresolvers import reverse_lazy
-from django.http import HttpResponse
+from django.http import HttpResponse, HttpResponseNotModified
 from django.http.response import JsonResponse, HttpResponseRedirect
 from django.utils.decorators import method_decorator
 from django.views.generic import FormView, ListView, TemplateView
@@ -20,7 +21,7 @@ from osgeo_importer.utils import import_all_layers
 from .forms import UploadFileForm
 from .importers import VALID_EXTENSIONS
 from .inspectors import OSGEO_INSPECTOR
-from .models import UploadedData, UploadFile
+from .models import UploadedData, UploadFile, UploadLayer
 from .utils import import_string, ImportHelper
 
 
@@ -108,18 +109,19 @@ class OneShotImportDemoView(TemplateView):
         return TemplateView.dispatch(self, request, *args, **kwargs)
 
 
+celery_to_api_status_map = {
+    'UNKNOWN': 'working',
+    'PENDING': 'working',
+    'SUCCESS': 'success',
+    'FAILURE': 'error',
+    'ERROR': 'error',
+}
+
+
 class UploadDataImportStatusView(View):
     def get(self, request, upload_id):
         ud = UploadedData.objects.prefetch_related('uploadfile_set__uploadlayer_set').get(id=upload_id)
 
-        celery_to_api_status_map = {
-            'UNKNOWN': 'working',
-            'PENDING': 'working',
-            'SUCCESS': 'success',
-            'FAILURE': 'error',
-            'ERROR': 'error',
-        }
-
         import_status = {
             uf.name: {
                 ul.layer_name: celery_to_api_status_map[ul.status] for ul in uf.uploadlayer_set.all()
@@ -129,6 +131,40 @@ class UploadDataImportStatusView(View):
         return JsonResponse(import_status)
 
 
+class UploadDataImportProgressView(View):
+    """
+    Returns the status and progress counters of each layer of an upload, read with a single query.
+
+    Responses carry an ETag, requests with a matching If-None-Match header get an empty 304 response.
+    """
+    def get(self, request, upload_id):
+        layers = UploadLayer.objects.filter(upload_file__upload_id=upload_id).values_list(
+            'upload_file__file', 'layer_name', 'import_status', 'import_stage', 'feature_count',
+            'features_processed', 'bytes_read')
+
+        import_progress = {}
+
+        for path, layer_name, status, stage, feature_count, features_processed, bytes_read in layers:
+            import_progress.setdefault(os.path.basename(path), {})[layer_name] = {
+                'status': celery_to_api_status_map[status or 'UNKNOWN'],
+                'stage': stage,
+                'features_total': feature_count,
+                'features_processed': features_processed,
+                'bytes_read': bytes_read,
+            }
+
+        content = json.dumps(import_progress, sort_keys=True)
+        etag = '"{0}"'.format(hashlib.md5(content).hexdigest())
+
+        if etag in [tag.strip() for tag in request.META.get('HTTP_IF_NONE_MATCH', '').split(',')]:
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(content, content_type='application/json')
+
+        response['ETag'] = etag
+        return response
+
+
 class BulkImport(TemplateView):
     template_name = 'osgeo_importer/bulk_import.html'
 
@@ -0,0 +1,902 @@
+import binascii
+import codecs
+import csv
+import fnmatch
+import logging
+import math
+import os
+import re
+import struct
+import time
+
+from django import db
+from django.conf import settings
+import gdal
+import ogr
+import osr
+
+from osgeo_importer.inspectors import IMPORT_CSV_X_FIELDS, IMPORT_CSV_Y_FIELDS
+from osgeo_importer.models import UploadLayer
+from osgeo_importer.utils import decode, quote_ident, database_schema_name, load_handler
+
+# Celery's prefork workers are daemonic processes, billiard allows them to start a pool of their own.
+try:
+    from billiard import Pool
+except ImportError:
+    from multiprocessing import Pool
+
+
+logger = logging.getLogger(__name__)
+ogr.UseExceptions()
+
+# EWKB flag signalling that a SRID follows the geometry type.
+EWKB_SRID_FLAG = 0x20000000
+# Import progress is published every PROGRESS_FEATURES features or PROGRESS_SECONDS seconds, whichever comes first.
+PROGRESS_FEATURES = getattr(settings, 'OSGEO_IMPORTER_PROGRESS_FEATURES', 10000)
+PROGRESS_SECONDS = getattr(settings, 'OSGEO_IMPORTER_PROGRESS_SECONDS', 5)
+
+
+class ImportProgress(object):
+    """
+    Publishes the progress of a layer import on its UploadLayer: the current stage, the number of features
+    processed and an estimate of the bytes read from the source file.  Feature counts are written at most once
+    every `every_features` features or `every_seconds` seconds.
+    """
+
+    def __init__(self, upload_layer_id, path=None, feature_count=None, every_features=PROGRESS_FEATURES,
+                 every_seconds=PROGRESS_SECONDS):
+        self.upload_layer_id = upload_layer_id
+        self.feature_count = feature_count
+        self.every_features = every_features
+        self.every_seconds = every_seconds
+        self.bytes_per_feature = 0
+        self.reported = 0
+        self.reported_at = time.time()
+
+        if path and feature_count and os.path.isfile(path):
+            self.bytes_per_feature = float(os.path.getsize(path)) / feature_count
+
+    def publish(self, **fields):
+        UploadLayer.objects.filter(id=self.upload_layer_id).update(**fields)
+
+    def stage(self, name):
+        """
+        Publishes the stage the import entered.
+        """
+        self.publish(import_stage=name)
+
+    def update(self, features, force=False):
+        """
+        Publishes the number of features processed, unless it was published only recently.
+        """
+        if not force and features - self.reported < self.every_features and \
+                time.time() - self.reported_at < self.every_seconds:
+            return
+
+        self.reported = features
+        self.reported_at = time.time()
+        self.publish(features_processed=features, bytes_read=int(features * self.bytes_per_feature))
+
+    def callback(self, complete, message, data):
+        """
+        GDAL progress callback, `complete` is the processed share of the features.
+        """
+        if self.feature_count:
+            self.update(int(complete * self.feature_count))
+
+        return 1
+
+
+def flush_target_layer(target_layer):
+    """
+    Makes OGR issue the statements it defers on a new target layer, the PostgreSQL driver only sends the CREATE
+    TABLE with the first feature.  Call it before the table is written, altered or queried through another
+    connection, which would not see the table otherwise.
+    """
+    target_layer.SyncToDisk()
+
+
+def update_fid_sequence(target_layer):
+    """
+    Keeps the FID sequence of a target table ahead of explicitly written FIDs.
+    """
+    table = '{0}.{1}'.format(quote_ident(database_schema_name()), quote_ident(target_layer.GetName()))
+    fid_column = target_layer.GetFIDColumn()
+
+    with db.connections[settings.OSGEO_DATASTORE].cursor() as cursor:
+        cursor.execute(
+            'SELECT setval(pg_get_serial_sequence(%s, %s), (SELECT COALESCE(MAX({0}), 0) + 1 FROM {1}), false);'
+            .format(quote_ident(fid_column), table), (table, fid_column)
+        )
+
+
+class FeatureWriterMixin(object):
+    """
+    Writers copy the features of a source layer into a target layer created by the importer.
+    """
+
+    def __init__(self, importer, source, transform=None, encoding=None, progress=None, *args, **kwargs):
+        self.importer = importer
+        self.source = source
+        # osr.CoordinateTransformation applied to the geometries while they are copied.
+        self.transform = transform
+        # Encoding of the source strings, None when they are UTF-8 already.
+        self.encoding = encoding
+        # ImportProgress the number of features copied is reported to, if any.
+        self.progress = progress
+        # Number of features written and distinct geometry types of the source features, None when unknown.
+        self.count = 0
+        self.geometry_types = set()
+        # Source FID of the last feature read and whether the FIDs were read in ascending order so far.
+        self.last_fid = None
+        self.fids_ascending = True
+
+    def can_write(self, layer, target_datastore, target_layer, source_fid=None):
+        """
+        Returns True if the writer is able to copy `layer` into the target layer.
+        """
+        return True
+
+    def write(self, layer, target_layer, layer_options, source_fid=None):
+        """
+        Copies the features of `layer` into `target_layer`.
+
+        :param layer: The source OGR layer.
+        :param target_layer: The OGR layer created by the importer.
+        :param layer_options: The layer configuration options (dict).
+        :param source_fid: Index of the source field holding the FID, if any.
+        :return: The number of features written.
+        """
+        raise NotImplementedError('Subclass should implement this.')
+
+    def track_fid(self, fid):
+        """
+        Records the source FID of the feature being written.
+        """
+        if self.last_fid is not None and fid <= self.last_fid:
+            self.fids_ascending = False
+
+        self.last_fid = fid
+
+    def checkpoint(self, layer_options, fid):
+        """
+        Records the source FID of the last feature committed to the target on the layer's UploadLayer, so an
+        interrupted import can resume after it.  Resuming skips the features up to the checkpointed FID, which
+        is only right when the source returns its features in ascending FID order: once a feature comes after a
+        higher FID (e.g. GeoJSON features with their own ids) the checkpoint is cleared for good.
+        """
+        upload_layer_id = layer_options.get('upload_layer_id')
+
+        if upload_layer_id is None or fid is None:
+            return
+
+        if not self.fids_ascending:
+            fid = None
+
+        UploadLayer.objects.filter(id=upload_layer_id).update(checkpoint_fid=fid)
+
+    def prepare_feature(self, layer, feature, target_layer, source_fid=None):
+        """
+        Applies the per-feature fixups needed before a feature is written: FID handling, reprojection, promotion
+        of single geometries to the Multi* type of the target and decoding of strings from the source encoding.
+        """
+        if not layer.GetFIDColumn():
+            feature.SetFID(-1)
+
+        if self.transform is not None:
+            feature.geometry().Transform(self.transform)
+
+        if feature.geometry().GetGeometryType() != target_layer.GetGeomType() and \
+                target_layer.GetGeomType() in range(4, 7):
+
+            if target_layer.GetGeomType() == 5:
+                conversion_function = ogr.ForceToMultiLineString
+            elif target_layer.GetGeomType() == 4:
+                conversion_function = ogr.ForceToMultiPoint
+            else:
+                conversion_function = ogr.ForceToMultiPolygon
+
+            geom = ogr.CreateGeometryFromWkb(feature.geometry().ExportToWkb())
+            feature.SetGeometry(conversion_function(geom))
+
+        if source_fid is not None:
+            feature.SetFID(feature.GetField(source_fid))
+
+        if self.encoding is not None:
+            for field in range(0, feature.GetFieldCount()):
+                if feature.GetFieldType(field) == ogr.OFTString and feature.IsFieldSet(field):
+                    feature.SetField(field, feature.GetField(field).decode(self.encoding, 'replace'))
+
+        return feature
+
+
+class OGRFeatureWriter(FeatureWriterMixin):
+    """
+    Writes features with OGR's CreateFeature.
+
+    Features are written in transactions of `importer.transaction_size` features when the target supports them,
+    which avoids a commit per feature on the PostgreSQL driver.  The open transaction is rolled back if a feature
+    cannot be created, the source FID of the last committed feature is checkpointed after every commit.
+    """
+
+    def write(self, layer, target_layer, layer_options, source_fid=None):
+        transaction_size = self.importer.transaction_size
+        use_transactions = transaction_size > 0 and target_layer.TestCapability(ogr.OLCTransactions)
+        in_transaction = False
+        pending = 0
+        self.count = 0
+
+        try:
+            for feature in layer:
+                if not feature or not feature.geometry():
+                    continue
+
+                if use_transactions and not in_transaction:
+                    target_layer.StartTransaction()
+                    in_transaction = True
+
+                self.geometry_types.add(feature.geometry().GetGeometryType())
+                self.track_fid(feature.GetFID())
+                self.prepare_feature(layer, feature, target_layer, source_fid)
+                target_layer.CreateFeature(feature)
+                self.count += 1
+                pending += 1
+
+                if self.progress is not None:
+                    self.progress.update(self.count)
+
+                if in_transaction and pending >= transaction_size:
+                    target_layer.CommitTransaction()
+                    in_transaction = False
+                    pending = 0
+                    self.checkpoint(layer_options, self.last_fid)
+
+            if in_transaction:
+                target_layer.CommitTransaction()
+                in_transaction = False
+                self.checkpoint(layer_options, self.last_fid)
+        except Exception:
+            logger.error('Create feature failed: {0}'.format(gdal.GetLastErrorMsg()))
+            if in_transaction:
+                target_layer.RollbackTransaction()
+            raise
+        finally:
+            layer.ResetReading()
+
+        return self.count
+
+
+class VectorTranslateWriter(FeatureWriterMixin):
+    """
+    Hands the whole layer to gdal.VectorTranslate so the copy runs entirely in C.
+
+    Only used for layers that need none of the fixups applied by `prepare_feature`: no per-feature Multi*
+    promotion, no FID remapping and no re-encoding of strings.  Features are appended to the table created by the
+    importer with an identity field map, so field names and `modified_fields` are the same as with the other
+    writers.
+    """
+
+    def can_write(self, layer, target_datastore, target_layer, source_fid=None):
+        if not hasattr(gdal, 'VectorTranslate'):
+            return False
+
+        if target_datastore.GetDriver().GetName() != 'PostgreSQL' or source_fid is not None:
+            return False
+
+        # Generic target geometry columns are promoted to Multi* by the importer after the load.
+        if target_layer.GetGeomType() not in (layer.GetGeomType(), ogr.wkbUnknown):
+            return False
+
+        definition = layer.GetLayerDefn()
+        fields = [definition.GetFieldDefn(i) for i in range(definition.GetFieldCount())]
+
+        # The importer does not create wkb_geometry attributes, an identity field map would be off by one.
+        if any(field.GetName() == 'wkb_geometry' for field in fields):
+            return False
+
+        has_strings = any(field.GetType() == ogr.OFTString for field in fields)
+        return not has_strings or self.encoding is None
+
+    def write(self, layer, target_layer, layer_options, source_fid=None):
+        self.geometry_types = None
+        flush_target_layer(target_layer)
+
+        options = ['-fieldmap', 'identity']
+
+        if self.importer.transaction_size > 0:
+            options.extend(['-gt', str(self.importer.transaction_size)])
+
+        if layer.GetFIDColumn():
+            options.append('-preserve_fid')
+
+        if self.transform is not None:
+            options.extend(['-t_srs', target_layer.GetSpatialRef().ExportToWkt()])
+
+        table = '{0}.{1}'.format(quote_ident(database_schema_name()), quote_ident(target_layer.GetName()))
+        logger.info('Copying layer "{}" into {} with gdal.VectorTranslate'.format(layer.GetName(), table))
+
+        try:
+            result = gdal.VectorTranslate(self.importer.target_store, self.source, accessMode='append',
+                                          layers=[layer.GetName()], layerName=target_layer.GetName(),
+                                          options=options,
+                                          callback=self.progress.callback if self.progress is not None else None)
+        finally:
+            layer.ResetReading()
+
+        if result is None:
+            msg = 'gdal.VectorTranslate failed: {0}'.format(gdal.GetLastErrorMsg())
+            logger.error(msg)
+            raise RuntimeError(msg)
+
+        # Close the datasource to flush any pending transaction.
+        result = None
+
+        with db.connections[settings.OSGEO_DATASTORE].cursor() as cursor:
+            # The feature loop skips features without a geometry, VectorTranslate copies them.
+            cursor.execute('DELETE FROM {0} WHERE {1} IS NULL;'.format(
+                table, quote_ident(target_layer.GetGeometryColumn())))
+            cursor.execute('SELECT count(*) FROM {0};'.format(table))
+            self.count = cursor.fetchone()[0]
+
+        return self.count
+
+
+class CopyStream(object):
+    """
+    A file-like object streaming rows to psycopg2's copy_expert.
+
+    Reading stops after `limit` rows so a single row iterator can be spread over several COPY statements.
+    """
+
+    def __init__(self, rows, limit=0):
+        self.rows = rows
+        self.limit = limit
+        self.count = 0
+        self.exhausted = False
+        self._buffer = ''
+
+    def read(self, size=-1):
+        while (size < 0 or len(self._buffer) < size) and not self.exhausted:
+            if self.limit and self.count >= self.limit:
+                break
+            try:
+                row = next(self.rows)
+            except StopIteration:
+                self.exhausted = True
+                break
+            self._buffer += row
+            self.count += 1
+
+        if size < 0:
+            data, self._buffer = self._buffer, ''
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    readline = read
+
+
+class PostgresCopyWriter(FeatureWriterMixin):
+    """
+    Streams features straight into the datastore table with COPY ... FROM STDIN, bypassing OGR's CreateFeature.
+
+    The table is still created by the importer through OGR so field laundering and `modified_fields` behave
+    as they do with the OGR writer.  Geometries are sent as EWKB hex, one COPY statement is issued (and
+    committed) per `importer.transaction_size` features, followed by a checkpoint of the last source FID.
+    """
+    copy_escapes = (('\\', '\\\\'), ('\t', '\\t'), ('\n', '\\n'), ('\r', '\\r'))
+
+    def can_write(self, layer, target_datastore, target_layer, source_fid=None):
+        return target_datastore.GetDriver().GetName() == 'PostgreSQL'
+
+    @classmethod
+    def escape(cls, value):
+        """
+        Escapes a value for the COPY text format.
+        """
+        if isinstance(value, unicode):
+            value = value.encode('utf8')
+
+        for char, replacement in cls.copy_escapes:
+            value = value.replace(char, replacement)
+
+        return value
+
+    @staticmethod
+    def format_datetime(feature, index, field_type):
+        year, month, day, hour, minute, second, tz_flag = feature.GetFieldAsDateTime(index)
+        date = '{0:04d}-{1:02d}-{2:02d}'.format(year, month, day)
+        time = '{0:02d}:{1:02d}:{2:09.6f}'.format(hour, minute, second)
+
+        if tz_flag >= 100:
+            offset = (tz_flag - 100) * 15
+            time += '{0}{1:02d}:{2:02d}'.format('+' if offset >= 0 else '-', abs(offset) // 60, abs(offset) % 60)
+
+        if field_type == ogr.OFTDate:
+            return date
+        if field_type == ogr.OFTTime:
+            return time
+        return '{0} {1}'.format(date, time)
+
+    @classmethod
+    def format_field(cls, feature, index, field_type):
+        """
+        Returns the COPY text representation of a feature's field.
+        """
+        is_set = getattr(feature, 'IsFieldSetAndNotNull', feature.IsFieldSet)
+
+        if not is_set(index):
+            return '\\N'
+
+        if field_type in (ogr.OFTDate, ogr.OFTTime, ogr.OFTDateTime):
+            return cls.format_datetime(feature, index, field_type)
+
+        if field_type == ogr.OFTBinary:
+            return '\\\\x' + binascii.hexlify(feature.GetFieldAsBinary(index))
+
+        if field_type in (ogr.OFTIntegerList, ogr.OFTInteger64List, ogr.OFTRealList):
+            return '{' + ','.join(str(v) for v in feature.GetField(index)) + '}'
+
+        if field_type == ogr.OFTStringList:
+            values = [decode(v) if isinstance(v, str) else v for v in feature.GetField(index)]
+            values = [u'"{0}"'.format(v.replace('\\', '\\\\').replace('"', '\\"')) for v in values]
+            return cls.escape(u'{' + u','.join(values) + u'}')
+
+        if field_type == ogr.OFTString:
+            return cls.escape(feature.GetField(index))
+
+        return feature.GetFieldAsString(index)
+
+    @staticmethod
+    def ewkb_hex(geometry, srid):
+        """
+        Returns the hex encoded EWKB of an OGR geometry.
+        """
+        wkb = geometry.ExportToWkb(ogr.wkbNDR)
+
+        if srid:
+            geom_type, = struct.unpack('<I', wkb[1:5])
+            wkb = wkb[0] + struct.pack('<II', geom_type | EWKB_SRID_FLAG, srid) + wkb[5:]
+
+        return binascii.hexlify(wkb)
+
+    @staticmethod
+    def field_mapping(layer, target_layer, modified_fields):
+        """
+        Returns a list of (source index, target column, field type) for the fields written by the importer.
+        """
+        source_definition = layer.GetLayerDefn()
+        target_definition = target_layer.GetLayerDefn()
+        mapping = []
+
+        for i in range(source_definition.GetFieldCount()):
+            field_def = source_definition.GetFieldDefn(i)
+            name = field_def.GetName()
+
+            if name == 'wkb_geometry':
+                continue
+
+            target_name = modified_fields.get(name, name)
+            target_index = target_definition.GetFieldIndex(target_name)
+
+            if target_index < 0:
+                target_index = target_definition.GetFieldIndex(target_name.lower())
+
+            if target_index < 0:
+                continue
+
+            mapping.append((i, target_definition.GetFieldDefn(target_index).GetName(), field_def.GetType()))
+
+        return mapping
+
+    def rows(self, layer, target_layer, mapping, write_fid, srid, source_fid):
+        processed = 0
+
+        for feature in layer:
+            if not feature or not feature.geometry():
+                continue
+
+            processed += 1
+            if self.progress is not None:
+                self.progress.update(processed)
+
+            self.geometry_types.add(feature.geometry().GetGeometryType())
+            self.track_fid(feature.GetFID())
+            self.prepare_feature(layer, feature, target_layer, source_fid)
+            values = [self.format_field(feature, i, field_type) for i, _, field_type in mapping]
+            values.append(self.ewkb_hex(feature.geometry(), srid))
+
+            if write_fid:
+                values.append(str(feature.GetFID()))
+
+            yield '\t'.join(values) + '\n'
+
+    def write(self, layer, target_layer, layer_options, source_fid=None):
+        flush_target_layer(target_layer)
+
+        table = '{0}.{1}'.format(quote_ident(database_schema_name()), quote_ident(target_layer.GetName()))
+        fid_column = target_layer.GetFIDColumn()
+        geometry_column = target_layer.GetGeometryColumn()
+        mapping = self.field_mapping(layer, target_layer, layer_options.get('modified_fields', {}))
+        write_fid = bool(fid_column) and (source_fid is not None or bool(layer.GetFIDColumn()))
+
+        columns = [quote_ident(column) for _, column, _ in mapping]
+        columns.append(quote_ident(geometry_column))
+
+        if write_fid:
+            columns.append(quote_ident(fid_column))
+
+        query = "COPY {0} ({1}) FROM STDIN WITH (ENCODING 'UTF8')".format(table, ', '.join(columns))
+        conn = db.connections[settings.OSGEO_DATASTORE]
+        self.count = 0
+
+        with conn.cursor() as cursor:
+            cursor.execute('SELECT Find_SRID(%s, %s, %s);',
+                           (database_schema_name(), target_layer.GetName(), geometry_column))
+            srid = cursor.fetchone()[0]
+            rows = self.rows(layer, target_layer, mapping, write_fid, srid, source_fid)
+
+            try:
+                while True:
+                    stream = CopyStream(rows, limit=self.importer.transaction_size)
+                    with db.transaction.atomic(using=settings.OSGEO_DATASTORE):
+                        cursor.copy_expert(query, stream)
+                    self.count += stream.count
+
+                    if stream.count:
+                        self.checkpoint(layer_options, self.last_fid)
+
+                    if stream.exhausted:
+                        break
+            except Exception:
+                logger.error('COPY into {0} failed after {1} features.'.format(table, self.count))
+                raise
+            finally:
+                layer.ResetReading()
+
+        if write_fid:
+            update_fid_sequence(target_layer)
+
+        return self.count
+
+
+class CSVCopyWriter(PostgresCopyWriter):
+    """
+    Loads CSV files without reading them in Python: the file is streamed into a temporary staging table of text
+    columns with COPY and the target rows, geometries included, are built from it with a single INSERT.
+
+    Columns are cast to the types of the target table, which follow OGR's (optionally sample based) type
+    detection for the file.  Values that do not parse as the column type are loaded as NULL, as OGR does.  Point
+    geometries are built with ST_MakePoint from the columns matching IMPORT_CSV_X_FIELDS and IMPORT_CSV_Y_FIELDS,
+    other geometries are parsed from the IMPORT_CSV_GEOM_FIELDS column OGR picked (WKT, hex WKB or GeoJSON).
+    """
+    delimiters = (',', ';', '\t', '|')
+    copy_encodings = {'utf-8': 'UTF8', 'iso8859-1': 'LATIN1', 'cp1252': 'WIN1252'}
+    integer_pattern = r'^\s*[-+]?[0-9]+\s*$'
+    real_pattern = r'^\s*[-+]?([0-9]+\.?[0-9]*|\.[0-9]+)([eE][-+]?[0-9]+)?\s*$'
+
+    def __init__(self, *args, **kwargs):
+        super(CSVCopyWriter, self).__init__(*args, **kwargs)
+        # Names of the temporary functions casting text to the other column types, by column type.
+        self.cast_functions = {}
+
+    @property
+    def path(self):
+        return self.source.GetDescription()
+
+    @property
+    def copy_encoding(self):
+        return self.copy_encodings.get(codecs.lookup(self.encoding or 'utf8').name)
+
+    def can_write(self, layer, target_datastore, target_layer, source_fid=None):
+        if not super(CSVCopyWriter, self).can_write(layer, target_datastore, target_layer, source_fid=source_fid):
+            return False
+
+        # Geometries are only built in SQL, FIDs are assigned by the target table.
+        if source_fid is not None or self.transform is not None or self.copy_encoding is None:
+            return False
+
+        # Zipped or remote files are read through GDAL's virtual file systems.
+        if self.source.GetDriver().ShortName.lower() != 'csv' or not os.path.isfile(self.path):
+            return False
+
+        _, header = self.read_header()
+        return len(header) == layer.GetLayerDefn().GetFieldCount() and self.geometry_fields(layer) is not None
+
+    def read_header(self):
+        """
+        Returns the delimiter and the column names of the file, the delimiter is detected like OGR does.
+        """
+        with open(self.path, 'rb') as f:
+            line = f.readline()
+
+        if line.startswith(codecs.BOM_UTF8):
+            line = line[len(codecs.BOM_UTF8):]
+
+        delimiter = max(self.delimiters, key=line.count)
+        return delimiter, next(csv.reader([line], delimiter=delimiter), [])
+
+    @staticmethod
+    def match_field(names, patterns):
+        for i, name in enumerate(names):
+            if any(fnmatch.fnmatch(name.lower(), pattern.lower()) for pattern in patterns):
+                return i
+
+    def geometry_fields(self, layer):
+        """
+        Returns the indexes of the x and y fields, or of the geometry field, the layer geometry is read from.
+        """
+        definition = layer.GetLayerDefn()
+        names = [definition.GetFieldDefn(i).GetName() for i in range(definition.GetFieldCount())]
+
+        if definition.GetGeomFieldCount() == 0:
+            return None
+
+        # OGR names geometry fields read from a GEOM_POSSIBLE_NAMES column geom_<column>.
+        geometry_name = definition.GetGeomFieldDefn(0).GetName()
+        if geometry_name.startswith('geom_') and geometry_name[len('geom_'):] in names:
+            return (names.index(geometry_name[len('geom_'):]),)
+
+        x = self.match_field(names, IMPORT_CSV_X_FIELDS)
+        y = self.match_field(names, IMPORT_CSV_Y_FIELDS)
+
+        if x is None or y is None:
+            return None
+
+        return x, y
+
+    def cast(self, column, column_type):
+        """
+        Returns the SQL expression casting a text column of the staging table to `column_type`.
+        """
+        if column_type in ('integer', 'bigint', 'smallint'):
+            return "CASE WHEN {0} ~ '{1}' THEN {0}::{2} END".format(column, self.integer_pattern, column_type)
+
+        if column_type in ('double precision', 'real') or column_type.startswith('numeric'):
+            return "CASE WHEN {0} ~ '{1}' THEN {0}::{2} END".format(column, self.real_pattern, column_type)
+
+        if column_type.startswith('character') or column_type in ('text', 'name'):
+            return column
+
+        # Dates and other values cannot be checked with a pattern, a function catches the cast errors instead.
+        return '{0}({1})'.format(self.cast_function(column_type), column)
+
+    def cast_function(self, column_type):
+        """
+        Returns the name of the temporary function casting text to `column_type`, NULL when the value is empty or
+        does not parse.  The functions are created by `create_cast_functions`.
+        """
+        if column_type not in self.cast_functions:
+            self.cast_functions[column_type] = 'pg_temp.csv_cast_{0}'.format(
+                re.sub('[^0-9a-z]+', '_', column_type.lower()).strip('_'))
+
+        return self.cast_functions[column_type]
+
+    def create_cast_functions(self, cursor):
+        """
+        Creates the cast functions returned by `cast_function` for the session of `cursor`.
+        """
+        for column_type, function in self.cast_functions.items():
+            cursor.execute(
+                "CREATE OR REPLACE FUNCTION {0}(value text) RETURNS {1} AS $$ "
+                "BEGIN RETURN NULLIF(trim(value), '')::{1}; "
+                "EXCEPTION WHEN data_exception THEN RETURN NULL; "
+                "END $$ LANGUAGE plpgsql STABLE;".format(function, column_type))
+
+    def geometry_expression(self, columns, geometry_fields, srid, geom_type):
+        if len(geometry_fields) == 2:
+            x, y = [columns[i] for i in geometry_fields]
+            expression = "CASE WHEN {0} ~ '{2}' AND {1} ~ '{2}' THEN ST_MakePoint({0}::float8, {1}::float8) END"\
+                .format(x, y, self.real_pattern)
+        else:
+            column = columns[geometry_fields[0]]
+            expression = ("CASE WHEN trim({0}) = '' THEN NULL "
+                          "WHEN {0} ~ '^\\s*[0-9A-Fa-f]+\\s*$' THEN ST_GeomFromEWKB(decode(trim({0}), 'hex')) "
+                          "WHEN {0} ~ '^\\s*{{' THEN ST_GeomFromGeoJSON({0}) "
+                          "ELSE ST_GeomFromText({0}) END").format(column)
+
+        if ogr.GT_Flatten(geom_type) in range(4, 7):
+            expression = 'ST_Multi({0})'.format(expression)
+
+        return 'ST_SetSRID({0}, {1})'.format(expression, int(srid))
+
+    def write(self, layer, target_layer, layer_options, source_fid=None):
+        self.geometry_types = None
+        flush_target_layer(target_layer)
+
+        schema = database_schema_name()
+        table = '{0}.{1}'.format(quote_ident(schema), quote_ident(target_layer.GetName()))
+        staging = quote_ident('{0}_csv'.format(target_layer.GetName()[:59]))
+        geometry_column = target_layer.GetGeometryColumn()
+        delimiter, header = self.read_header()
+        columns = ['c{0}'.format(i) for i in range(len(header))]
+        mapping = self.field_mapping(layer, target_layer, layer_options.get('modified_fields', {}))
+
+        with db.transaction.atomic(using=settings.OSGEO_DATASTORE):
+            with db.connections[settings.OSGEO_DATASTORE].cursor() as cursor:
+                cursor.execute('SELECT Find_SRID(%s, %s, %s);', (schema, target_layer.GetName(), geometry_column))
+                srid = cursor.fetchone()[0]
+                cursor.execute('SELECT attname, format_type(atttypid, atttypmod) FROM pg_attribute '
+                               'WHERE attrelid = %s::regclass AND attnum > 0 AND NOT attisdropped;', (table,))
+                column_types = dict(cursor.fetchall())
+
+                cursor.execute('CREATE TEMPORARY TABLE {0} ({1}) ON COMMIT DROP;'.format(
+                    staging, ', '.join('{0} text'.format(column) for column in columns)))
+
+                # Unquoted empty values are loaded as empty strings, like OGR reads them.
+                with open(self.path, 'rb') as f:
+                    cursor.copy_expert(
+                        "COPY {0} FROM STDIN WITH (FORMAT csv, HEADER true, DELIMITER E'{1}', ENCODING '{2}', "
+                        "FORCE_NOT_NULL ({3}))".format(staging, {'\t': '\\t'}.get(delimiter, delimiter),
+                                                       self.copy_encoding, ', '.join(columns)), f)
+
+                targets = [quote_ident(column) for _, column, _ in mapping]
+                values = [self.cast(columns[i], column_types.get(column, 'text')) for i, column, _ in mapping]
+                geometry = self.geometry_expression(columns, self.geometry_fields(layer), srid,
+                                                    target_layer.GetGeomType())
+                self.create_cast_functions(cursor)
+
+                logger.info('Building {} rows from the staged CSV file'.format(table))
+                cursor.execute(
+                    'INSERT INTO {0} ({1}) SELECT * FROM (SELECT {2} FROM {3}) AS csv_rows '
+                    'WHERE {4} IS NOT NULL;'.format(
+                        table, ', '.join(targets + [quote_ident(geometry_column)]),
+                        ', '.join(values + ['{0} AS {1}'.format(geometry, quote_ident(geometry_column))]),
+                        staging, quote_ident(geometry_column)))
+                self.count = cursor.rowcount
+
+        return self.count
+
+
+class LayerRange(object):
+    """
+    Restricts iteration over an OGR layer to `count` features starting at feature index `start`.
+    Other attributes are looked up on the wrapped layer.
+    """
+
+    def __init__(self, layer, start, count):
+        self.layer = layer
+        self.start = start
+        self.count = count
+
+    def __getattr__(self, name):
+        return getattr(self.layer, name)
+
+    def __iter__(self):
+        self.layer.SetNextByIndex(self.start)
+
+        for _ in xrange(self.count):
+            feature = self.layer.GetNextFeature()
+
+            if feature is None:
+                break
+
+            yield feature
+
+
+def copy_feature_range(options):
+    """
+    Copies a range of features of a source layer into an existing target layer.
+
+    Runs in a worker process of ParallelCopyWriter with its own source handle and datastore connections.
+    :return: The number of features written and the geometry types of the source features.
+    """
+    importer = load_handler(options['importer'], options['source'])
+    importer.target_store = options['target_store']
+    importer.transaction_size = options['transaction_size']
+
+    source, _ = importer.open_source_datastore(options['source'], **options['open_options'])
+    layer = source.GetLayerByName(options['layer'])
+
+    if options['ignored_fields']:
+        layer.SetIgnoredFields(options['ignored_fields'])
+
+    target, target_inspector = importer.open_target_datastore(options['target_store'])
+    target_layer = target.GetLayerByName(options['target_layer'])
+    transform = None
+
+    if options['source_srs']:
+        transform = importer.get_coordinate_transformation(osr.SpatialReference(options['source_srs']),
+                                                           osr.SpatialReference(options['target_srs']))
+
+    writer = load_handler(options['writer'], importer, source, transform=transform, encoding=options['encoding'])
+    feature_range = LayerRange(layer, options['start'], options['count'])
+
+    if not writer.can_write(feature_range, target, target_layer, source_fid=options['source_fid']):
+        writer = OGRFeatureWriter(importer, source, transform=transform, encoding=options['encoding'])
+
+    writer.write(feature_range, target_layer, options['layer_options'], source_fid=options['source_fid'])
+    target_inspector.close()
+    return writer.count, writer.geometry_types
+
+
+class ParallelCopyWriter(FeatureWriterMixin):
+    """
+    Splits large layers into ranges of features and copies them concurrently into the target table.
+
+    Each range is copied by the importer's configured feature writer in a separate process with its own source
+    handle and datastore connections.  The degree of parallelism is `importer.parallel_copy_processes`, only
+    layers with at least `importer.parallel_copy_min_features` features and fast random access
+    (OLCFastSetNextByIndex) are split.  The ranges are committed independently, so when a worker fails the table
+    is truncated before the error is raised.
+    """
+
+    def can_write(self, layer, target_datastore, target_layer, source_fid=None):
+        if self.importer.parallel_copy_processes < 2:
+            return False
+
+        if target_datastore.GetDriver().GetName() != 'PostgreSQL':
+            return False
+
+        if not layer.TestCapability(ogr.OLCFastSetNextByIndex):
+            return False
+
+        # Only use counts the driver can return without reading the layer.
+        return layer.GetFeatureCount(0) >= self.importer.parallel_copy_min_features
+
+    def write(self, layer, target_layer, layer_options, source_fid=None):
+        processes = self.importer.parallel_copy_processes
+        feature_count = layer.GetFeatureCount()
+        range_size = int(math.ceil(float(feature_count) / processes))
+        importer_class = type(self.importer)
+
+        options = {
+            'importer': '{0}.{1}'.format(importer_class.__module__, importer_class.__name__),
+            'source': self.importer.file,
+            'open_options': getattr(self.importer, 'source_open_options', {}),
+            'encoding': self.encoding,
+            'layer': layer.GetName(),
+            'ignored_fields': ['wkb_geometry'] if layer.GetLayerDefn().GetFieldIndex('wkb_geometry') >= 0 else [],
+            'target_store': self.importer.target_store,
+            'target_layer': target_layer.GetName(),
+            'transaction_size': self.importer.transaction_size,
+            'writer': self.importer.feature_writer,
+            'layer_options': {'modified_fields': layer_options.get('modified_fields', {})},
+            'source_fid': source_fid,
+            'source_srs': None,
+            'target_srs': None,
+        }
+
+        if self.transform is not None:
+            options['source_srs'] = layer.GetSpatialRef().ExportToWkt()
+            options['target_srs'] = target_layer.GetSpatialRef().ExportToWkt()
+
+        ranges = [dict(options, start=start, count=range_size) for start in range(0, feature_count, range_size)]
+        logger.info('Copying {} features of "{}" in {} ranges with {} processes'.format(
+            feature_count, layer.GetName(), len(ranges), processes))
+
+        flush_target_layer(target_layer)
+        # Forked workers must not share the database connections of this process.
+        db.connections.close_all()
+
+        self.count = 0
+        pool = Pool(processes=processes)
+        completed = False
+
+        try:
+            for count, geometry_types in pool.imap_unordered(copy_feature_range, ranges):
+                self.count += count
+                self.geometry_types |= geometry_types
+
+                if self.progress is not None:
+                    self.progress.update(self.count)
+            pool.close()
+            completed = True
+        except Exception:
+            logger.error('Parallel copy of "{}" failed after {} features.'.format(layer.GetName(), self.count))
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+
+            if not completed:
+                # Remove the ranges the other workers committed, a failed copy does not leave a partial table.
+                table = '{0}.{1}'.format(quote_ident(database_schema_name()), quote_ident(target_layer.GetName()))
+                with db.connections[settings.OSGEO_DATASTORE].cursor() as cursor:
+                    cursor.execute('TRUNCATE {0};'.format(table))
+
+        if target_layer.GetFIDColumn() and (source_fid is not None or layer.GetFIDColumn()):
+            # Workers only see their own FIDs when updating the sequence.
+            update_fid_sequence(target_layer)
+
+        return self.count